@@ -0,0 +1,401 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Headless benchmarks for the compiler, the visual tree and the painter overlay.
+#
+#   python benchmarks/benchmark.py --output results.json
+#   python benchmarks/benchmark.py --quick --compare results.json
+#
+# Results are written as json, --compare exits with 1 when a benchmark is slower
+# than the baseline by more than --threshold.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Qt import QtCore, QtGui, QtWidgets, __binding__
+
+from qss_debugger.compiler import VisualCompilerDefault, VisualSegmentCache
+from qss_debugger.explorer import VisualTreeExplorer
+from qss_debugger.painter import VisualTreePainter
+from qss_debugger.search import VisualSearchIndex
+from qss_debugger.snapshot import VisualLayoutSnapshot
+from qss_debugger.spatial import VisualSpatialIndex
+
+
+# *********************************************************************
+# +++ CONSTANTS
+# *********************************************************************
+clock = getattr(time, 'perf_counter', time.time)
+
+FULL_SIZES = {'segments': [10, 100, 1000],
+              'vars': [10, 1000, 10000],
+              'widgets': [1000, 10000, 100000],
+              'painted': [10, 100, 1000]}
+
+QUICK_SIZES = {'segments': [10, 100],
+               'vars': [10, 1000],
+               'widgets': [1000, 10000],
+               'painted': [10, 100]}
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualBenchmark(object):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, repeat=5):
+        self._repeat = repeat
+        self._application = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        self._temp_path = tempfile.mkdtemp(prefix='qss_debugger_benchmark_')
+        self.results = []
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _time(self, name, parameters, function, setup=None, repeat=None):
+        durations = []
+
+        for _ in range(repeat or self._repeat):
+            if setup:
+                setup()
+
+            start_time = clock()
+            function()
+            durations.append((clock() - start_time) * 1000.0)
+
+        durations.sort()
+        result = {'name': name,
+                  'parameters': parameters,
+                  'min_ms': durations[0],
+                  'median_ms': durations[len(durations) // 2],
+                  'max_ms': durations[-1]}
+
+        self.results.append(result)
+        print('{:<40} {:<32} {:>10.2f} ms'.format(name, json.dumps(parameters), result['median_ms']))
+
+    def _make_theme(self, segment_count, var_count):
+        theme_path = os.path.join(self._temp_path, 'theme_{}_{}'.format(segment_count, var_count))
+        segments_path = os.path.join(theme_path, 'segments')
+        vars_path = os.path.join(theme_path, 'vars')
+
+        if os.path.isdir(theme_path):
+            return segments_path, vars_path
+
+        os.makedirs(segments_path)
+        os.makedirs(vars_path)
+
+        random_generator = random.Random(segment_count * 100003 + var_count)
+
+        with open(os.path.join(vars_path, 'vars.txt'), 'w') as file_handle:
+            for var_index in range(var_count):
+                file_handle.write('@var{}: #{:06x}\n'.format(var_index, random_generator.randint(0, 0xffffff)))
+
+        for segment_index in range(segment_count):
+            with open(os.path.join(segments_path, 'segment_{:04d}.qss'.format(segment_index)), 'w') as file_handle:
+                for rule_index in range(20):
+                    file_handle.write('QWidget#w{}_{} QPushButton:hover {{\n'
+                                      '    color: @var{};\n'
+                                      '    background-color: @var{};\n'
+                                      '    border: 1px solid @var{};\n'
+                                      '}}\n'.format(segment_index, rule_index,
+                                                    random_generator.randrange(var_count),
+                                                    random_generator.randrange(var_count),
+                                                    random_generator.randrange(var_count)))
+
+        return segments_path, vars_path
+
+    def _make_hierarchy(self, widget_count, branching=10):
+        root = QtWidgets.QWidget()
+        parents = [root]
+        widgets = []
+
+        while len(widgets) < widget_count - 1:
+            next_parents = []
+
+            for parent in parents:
+                for _ in range(branching):
+                    if len(widgets) == widget_count - 1:
+                        break
+
+                    widget = QtWidgets.QWidget(parent)
+                    widgets.append(widget)
+                    next_parents.append(widget)
+
+            parents = next_parents
+
+        return root, widgets
+
+    def _tile_hierarchy(self, root, size=4096):
+        # Splits every widget between its children, alternating columns and rows.
+        root.setGeometry(0, 0, size, size)
+        stack = [(root, 0)]
+
+        while stack:
+            parent, depth = stack.pop()
+            children = parent.findChildren(QtWidgets.QWidget, '', QtCore.Qt.FindDirectChildrenOnly)
+
+            for child_index, child in enumerate(children):
+                if depth % 2:
+                    step = parent.height() // len(children)
+                    child.setGeometry(0, child_index * step, parent.width(), step)
+                else:
+                    step = parent.width() // len(children)
+                    child.setGeometry(child_index * step, 0, step, parent.height())
+
+                stack.append((child, depth + 1))
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def run_compiler(self, sizes):
+        for segment_count in sizes['segments']:
+            for var_count in sizes['vars']:
+                segments_path, vars_path = self._make_theme(segment_count, var_count)
+                parameters = {'segments': segment_count, 'vars': var_count}
+
+                self._time('compiler.compile', parameters,
+                           lambda: VisualCompilerDefault.compile(segments_path, vars_path))
+
+                segment_cache = VisualSegmentCache()
+                VisualCompilerDefault.compile(segments_path, vars_path, segment_cache=segment_cache)
+                self._time('compiler.compile_incremental_unchanged', parameters,
+                           lambda: VisualCompilerDefault.compile(segments_path, vars_path,
+                                                                 segment_cache=segment_cache))
+
+                template = VisualCompilerDefault.compile_template(segments_path)
+                VisualCompilerDefault.render(template, vars_path)
+                self._time('compiler.render_template', parameters,
+                           lambda: VisualCompilerDefault.render(template, vars_path))
+
+                changed_path = VisualSegmentCache.list_segments(segments_path)[0]
+
+                def touch_segment():
+                    with open(changed_path, 'a') as file_handle:
+                        file_handle.write('\n')
+
+                self._time('compiler.compile_incremental_one_changed', parameters,
+                           lambda: VisualCompilerDefault.compile(segments_path, vars_path,
+                                                                 segment_cache=segment_cache,
+                                                                 changed_paths=[changed_path]),
+                           setup=touch_segment)
+
+    def run_tree(self, sizes):
+        explorer = VisualTreeExplorer()
+        explorer.show()
+
+        for widget_count in sizes['widgets']:
+            root, widgets = self._make_hierarchy(widget_count)
+            parameters = {'widgets': widget_count}
+
+            def update_tree():
+                explorer.update_tree(root)
+                self._application.processEvents()
+
+            self._time('explorer.update_tree', parameters, update_tree)
+
+            random_generator = random.Random(widget_count)
+            targets = [random_generator.choice(widgets) for _ in range(self._repeat)]
+
+            def select_next():
+                explorer.set_selected_item(targets.pop())
+                self._application.processEvents()
+
+            update_tree()
+            self._time('explorer.set_selected_item', parameters, select_next)
+
+            # Hidden widgets don't get move events until they are shown.
+            self._tile_hierarchy(root)
+            root.show()
+            self._application.processEvents()
+
+            spatial_index = VisualSpatialIndex(root)
+            self._time('spatial.start', parameters, spatial_index.start, setup=spatial_index.stop, repeat=1)
+
+            points = [QtCore.QPoint(random_generator.randrange(4096), random_generator.randrange(4096))
+                      for _ in range(1000)]
+
+            def query_points():
+                for point in points:
+                    spatial_index.widgets_at(point)
+
+            self._time('spatial.widgets_at_x1000', parameters, query_points)
+
+            moved_widgets = [random_generator.choice(widgets) for _ in range(self._repeat)]
+
+            def move_one():
+                moved_widget = moved_widgets.pop()
+                moved_widget.move(moved_widget.x() + 1, moved_widget.y())
+                spatial_index.widgets_at(points[0])
+
+            self._time('spatial.move_and_query', parameters, move_one)
+            spatial_index.stop()
+
+            self._time('snapshot.capture', parameters, lambda: VisualLayoutSnapshot.capture(root))
+
+            layout_snapshot = VisualLayoutSnapshot.capture(root)
+            for moved_widget in random_generator.sample(widgets, 10):
+                moved_widget.move(moved_widget.x() + 1, moved_widget.y())
+            moved_snapshot = VisualLayoutSnapshot.capture(root)
+
+            self._time('snapshot.diff', parameters, lambda: layout_snapshot.diff(moved_snapshot))
+
+            search_index = VisualSearchIndex()
+            search_index.set_root(root)
+
+            def index_all():
+                search_index.start()
+
+                while search_index.is_indexing:
+                    self._application.processEvents()
+
+            self._time('search.start', parameters, index_all, setup=search_index.stop, repeat=1)
+
+            for widget in widgets[::100]:
+                widget.setObjectName('named_{}'.format(id(widget)))
+            self._application.processEvents()
+
+            self._time('search.query', parameters, lambda: search_index.search('name:named type:qwidget'))
+            search_index.stop()
+
+            explorer.update_tree(QtWidgets.QWidget())
+            root.deleteLater()
+            QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+
+        explorer.close()
+
+    def run_painter(self, sizes):
+        window = QtWidgets.QWidget()
+        window.resize(1600, 1200)
+        grid_layout = QtWidgets.QGridLayout(window)
+
+        painted_count = max(sizes['painted'])
+        columns = 40
+        items = []
+
+        for item_index in range(painted_count):
+            item = QtWidgets.QLabel(str(item_index))
+            grid_layout.addWidget(item, item_index // columns, item_index % columns)
+            items.append(item)
+
+        painter = VisualTreePainter(window)
+        window.show()
+        self._application.processEvents()
+
+        image = QtGui.QImage(painter.size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+
+        for item_count in sizes['painted']:
+            parameters = {'items': item_count}
+
+            def select_items():
+                painter.current_items = []
+                painter.current_items = items[:item_count]
+
+            self._time('painter.paintEvent_first', parameters, lambda: painter.render(image), setup=select_items)
+            self._time('painter.paintEvent_cached', parameters, lambda: painter.render(image))
+
+        window.close()
+
+    def cleanup(self):
+        shutil.rmtree(self._temp_path, ignore_errors=True)
+
+    def report(self):
+        return {'environment': {'python': platform.python_version(),
+                                'binding': __binding__,
+                                'qt': QtCore.qVersion(),
+                                'platform': platform.platform()},
+                'repeat': self._repeat,
+                'results': self.results}
+
+
+# *********************************************************************
+# +++ FUNCTIONS
+# *********************************************************************
+def compare(report, baseline, threshold):
+    baseline_results = dict([((result['name'], json.dumps(result['parameters'], sort_keys=True)), result)
+                             for result in baseline['results']])
+    regressions = []
+
+    for result in report['results']:
+        baseline_result = baseline_results.get((result['name'], json.dumps(result['parameters'], sort_keys=True)))
+
+        if baseline_result and result['median_ms'] > baseline_result['median_ms'] * threshold:
+            regressions.append((result, baseline_result))
+
+    for result, baseline_result in regressions:
+        print('REGRESSION {} {}: {:.2f} ms -> {:.2f} ms'.format(
+            result['name'], json.dumps(result['parameters']), baseline_result['median_ms'], result['median_ms']))
+
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Headless qss_debugger benchmarks.')
+    parser.add_argument('--quick', action='store_true', help='Smaller workloads.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per benchmark, the median is reported.')
+    parser.add_argument('--only', choices=['compiler', 'tree', 'painter'], action='append',
+                        help='Only run these benchmark groups.')
+    parser.add_argument('--output', help='Json file the results are written to.')
+    parser.add_argument('--compare', help='Baseline json file to compare against.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown ratio over the baseline reported as a regression.')
+    arguments = parser.parse_args(arguments)
+
+    sizes = QUICK_SIZES if arguments.quick else FULL_SIZES
+    groups = arguments.only or ['compiler', 'tree', 'painter']
+
+    benchmark = VisualBenchmark(arguments.repeat)
+
+    try:
+        if 'compiler' in groups:
+            benchmark.run_compiler(sizes)
+        if 'tree' in groups:
+            benchmark.run_tree(sizes)
+        if 'painter' in groups:
+            benchmark.run_painter(sizes)
+    finally:
+        benchmark.cleanup()
+
+    report = benchmark.report()
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file_handle:
+            json.dump(report, file_handle, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare, 'r') as file_handle:
+            baseline = json.load(file_handle)
+
+        if compare(report, baseline, arguments.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import traceback
+
+from Qt import QtCore
+
+from qss_debugger.compiler import clock
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualBuildResult(object):
+    def __init__(self, style_sheet, rules=None, segment_hits=0, segment_misses=0, timings=None, cached=False,
+                 vars_index=None, changed_vars=None, optimize_report=None, unresolved_vars=None, invalid_vars=None):
+        self.style_sheet = style_sheet
+        self.rules = rules
+        self.segment_hits = segment_hits
+        self.segment_misses = segment_misses
+        self.timings = timings if timings is not None else {}
+        self.cached = cached
+        self.vars_index = vars_index
+        self.changed_vars = changed_vars if changed_vars is not None else []
+        self.optimize_report = optimize_report
+        self.unresolved_vars = unresolved_vars if unresolved_vars is not None else []
+        self.invalid_vars = invalid_vars if invalid_vars is not None else []
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualBuildSignals(QtCore.QObject):
+    # QRunnable is not a QObject, the task reports back through this object which
+    # lives in the GUI thread so the signals are queued to it.
+    finished = QtCore.Signal(int, object, float)
+    failed = QtCore.Signal(int, str)
+    skipped = QtCore.Signal(int)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualBuildTask(QtCore.QRunnable):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, build_id, build_queue, function, args, kwargs):
+        super(VisualBuildTask, self).__init__()
+        self.setAutoDelete(False)
+
+        self.signals = VisualBuildSignals()
+        self._build_id = build_id
+        self._build_queue = build_queue
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def build_id(self):
+        return self._build_id
+
+    # ====================================================================
+    # +++ OVERRIDES
+    # =====================================================================
+    def run(self):
+        # A newer build was submitted while this one was waiting, don't even start.
+        if self._build_queue.is_superseded(self._build_id):
+            self.signals.skipped.emit(self._build_id)
+            return
+
+        start_time = clock()
+
+        try:
+            result = self._function(*self._args, **self._kwargs)
+        except Exception:
+            self.signals.failed.emit(self._build_id, traceback.format_exc())
+            return
+
+        self.signals.finished.emit(self._build_id, result, clock() - start_time)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualBuildQueue(QtCore.QObject):
+    # =====================================================================
+    # +++ SIGNALS
+    # =====================================================================
+    build_finished = QtCore.Signal(object, float)
+    build_failed = QtCore.Signal(str)
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None):
+        super(VisualBuildQueue, self).__init__(parent)
+        self._latest_build_id = 0
+        self._tasks = {}
+
+        # Builds share caches that are not thread safe, they run one at a time
+        # in submission order and only the latest result is ever delivered.
+        self._thread_pool = QtCore.QThreadPool(self)
+        self._thread_pool.setMaxThreadCount(1)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def queue_depth(self):
+        return len(self._tasks)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def submit(self, function, *args, **kwargs):
+        self._latest_build_id += 1
+
+        task = VisualBuildTask(self._latest_build_id, self, function, args, kwargs)
+        task.signals.finished.connect(self._task_finished)
+        task.signals.failed.connect(self._task_failed)
+        task.signals.skipped.connect(self._task_done)
+
+        self._tasks[task.build_id] = task
+        self._thread_pool.start(task)
+
+        return task.build_id
+
+    def is_superseded(self, build_id):
+        return build_id != self._latest_build_id
+
+    def wait(self, timeout=-1):
+        return self._thread_pool.waitForDone(timeout)
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _task_done(self, build_id):
+        self._tasks.pop(build_id, None)
+
+    def _task_finished(self, build_id, result, duration):
+        self._task_done(build_id)
+
+        if not self.is_superseded(build_id):
+            self.build_finished.emit(result, duration)
+
+    def _task_failed(self, build_id, message):
+        self._task_done(build_id)
+
+        if not self.is_superseded(build_id):
+            self.build_failed.emit(message)
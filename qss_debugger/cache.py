@@ -0,0 +1,270 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import os
+import json
+import hashlib
+import tempfile
+
+from qss_debugger.compiler import VisualSegmentCache
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualCompileCache(object):
+    # On disk cache of compiled style sheets, addressed by the content hash of the
+    # segments, the vars files and the compiler version. Entries can't go stale,
+    # a change in any input is a different key, they are evicted least recently
+    # used first (by file mtime) once the folder grows over max_size bytes.
+    # Everything is written to a temporary file and renamed so a crash or another
+    # process never leaves a partial entry behind.
+    VERSION = 1
+    ENTRY_EXTENSION = '.json'
+    DIGESTS_FILE_NAME = 'digests.dat'
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, folder_path, max_size=32 * 1024 * 1024):
+        self._folder_path = folder_path
+        self._max_size = max_size
+
+        # {file path: (mtime, size, digest)}, files whose stat didn't change are not
+        # read again to compute the key.
+        self._digests = None
+
+        self.hits = 0
+        self.misses = 0
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def compiler_version(compiler_type):
+        return '{}.{}:{}'.format(compiler_type.__module__, compiler_type.__name__,
+                                 getattr(compiler_type, 'VERSION', 0))
+
+    @staticmethod
+    def _write_atomic(file_path, content):
+        file_handle, temp_file_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+
+        try:
+            with os.fdopen(file_handle, 'w') as temp_file:
+                temp_file.write(content)
+
+            # os.rename can't replace an existing file on windows.
+            getattr(os, 'replace', os.rename)(temp_file_path, file_path)
+        except (IOError, OSError):
+            if os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _ensure_folder(self):
+        if not os.path.isdir(self._folder_path):
+            os.makedirs(self._folder_path)
+
+    def _entry_path(self, key):
+        return os.path.join(self._folder_path, key + self.ENTRY_EXTENSION)
+
+    def _load_digests(self):
+        self._digests = {}
+
+        try:
+            with open(os.path.join(self._folder_path, self.DIGESTS_FILE_NAME), 'r') as file_handle:
+                digests = json.load(file_handle)
+        except (IOError, OSError, ValueError):
+            return
+
+        if isinstance(digests, dict) and digests.get('version') == self.VERSION:
+            self._digests = dict([(file_path, tuple(state)) for file_path, state in digests['files'].items()])
+
+    def _save_digests(self):
+        try:
+            self._ensure_folder()
+            self._write_atomic(os.path.join(self._folder_path, self.DIGESTS_FILE_NAME),
+                               json.dumps({'version': self.VERSION, 'files': self._digests}))
+        except (IOError, OSError):
+            pass
+
+    def _file_digest(self, file_path):
+        file_stat = os.stat(file_path)
+        state = self._digests.get(file_path)
+
+        if state and state[0] == file_stat.st_mtime and state[1] == file_stat.st_size:
+            return state[2]
+
+        with open(file_path, 'rb') as file_handle:
+            digest = hashlib.md5(file_handle.read()).hexdigest()
+
+        self._digests[file_path] = (file_stat.st_mtime, file_stat.st_size, digest)
+        return digest
+
+    def _entries(self):
+        # [(mtime, size, path)] of the entries on disk, oldest first.
+        try:
+            file_names = os.listdir(self._folder_path)
+        except OSError:
+            return []
+
+        entries = []
+        for file_name in file_names:
+            if not file_name.endswith(self.ENTRY_EXTENSION):
+                continue
+
+            file_path = os.path.join(self._folder_path, file_name)
+
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+
+            entries.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total_size = sum([entry[1] for entry in entries])
+
+        for _, size, file_path in entries:
+            if total_size <= self._max_size:
+                break
+
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+
+            total_size -= size
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def folder_path(self):
+        return self._folder_path
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @property
+    def size(self):
+        return sum([entry[1] for entry in self._entries()])
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def key(self, qss_folder_path, qss_vars_folder_path, compiler_type):
+        if self._digests is None:
+            self._load_digests()
+
+        digests = dict(self._digests)
+        segment_paths = VisualSegmentCache.list_segments(qss_folder_path)
+        vars_paths = [os.path.join(os.path.normpath(qss_vars_folder_path), file_name)
+                      for file_name in sorted(os.listdir(qss_vars_folder_path))]
+
+        key_hash = hashlib.md5()
+        key_hash.update('{}\n{}\n'.format(self.VERSION, self.compiler_version(compiler_type)).encode('utf-8'))
+
+        # Names are part of the key, the segments order and the vars precedence
+        # depend on them.
+        for section, file_paths in [('segments', segment_paths), ('vars', vars_paths)]:
+            key_hash.update('{}\n'.format(section).encode('utf-8'))
+
+            for file_path in file_paths:
+                key_hash.update('{}:{}\n'.format(os.path.basename(file_path),
+                                                 self._file_digest(file_path)).encode('utf-8'))
+
+        # Forget the files of these folders that are not inputs anymore.
+        input_folder_paths = set([os.path.normpath(qss_folder_path), os.path.normpath(qss_vars_folder_path)])
+        input_paths = set(segment_paths + vars_paths)
+
+        for file_path in list(self._digests):
+            if os.path.dirname(file_path) in input_folder_paths and file_path not in input_paths:
+                del self._digests[file_path]
+
+        if self._digests != digests:
+            self._save_digests()
+
+        return key_hash.hexdigest()
+
+    def load(self, key):
+        # Returns the stored {'style_sheet', 'segment_lines'} or None.
+        entry_path = self._entry_path(key)
+
+        try:
+            with open(entry_path, 'r') as file_handle:
+                entry = json.load(file_handle)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except ValueError:
+            entry = None
+
+        if not isinstance(entry, dict) or entry.get('version') != self.VERSION or entry.get('key') != key:
+            # Unreadable or written by another version, drop it.
+            self.remove(key)
+            self.misses += 1
+            return None
+
+        # Mark as recently used.
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return {'style_sheet': entry['style_sheet'],
+                'segment_lines': [tuple(segment_line) for segment_line in entry['segment_lines']]}
+
+    def store(self, key, style_sheet, segment_lines=None):
+        try:
+            self._ensure_folder()
+            self._write_atomic(self._entry_path(key), json.dumps({'version': self.VERSION,
+                                                                  'key': key,
+                                                                  'style_sheet': style_sheet,
+                                                                  'segment_lines': segment_lines or []}))
+        except (IOError, OSError):
+            return False
+
+        self._evict()
+        return True
+
+    def remove(self, key):
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for _, _, file_path in self._entries():
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+        try:
+            os.remove(os.path.join(self._folder_path, self.DIGESTS_FILE_NAME))
+        except OSError:
+            pass
+
+        self._digests = {}
@@ -0,0 +1,203 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Batch compiler, doesn't import Qt so it can run on build machines.
+#
+#   qss-compile --job segments/dark vars/dark build/dark.qss --job ...
+#   qss-compile --jobs-file themes.json --processes 8
+#   qss-compile --jobs-file themes.json --check
+#   qss-compile --jobs-file themes.json --optimize
+#
+# A jobs file is a json list of {"segments": ..., "vars": ..., "output": ...},
+# relative paths are relative to the jobs file. "optimize": true optimizes that
+# job only.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import os
+import sys
+import json
+import argparse
+import importlib
+import traceback
+import multiprocessing
+
+from qss_debugger.compiler import VisualCompilerBase, VisualCompilerDefault, clock
+from qss_debugger.optimizer import VisualQssOptimizer
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualCompileJob(object):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, segments_path, vars_path, output_path=None, compiler_name=None, optimize=False):
+        self.segments_path = segments_path
+        self.vars_path = vars_path
+        self.output_path = output_path
+        self.compiler_name = compiler_name
+        self.optimize = optimize
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def load_compiler(compiler_name):
+        # 'package.module:Class', jobs only carry the name so they can be sent to
+        # other processes.
+        if not compiler_name:
+            return VisualCompilerDefault
+
+        module_name, class_name = compiler_name.split(':')
+        return getattr(importlib.import_module(module_name), class_name)
+
+    @staticmethod
+    def load_jobs(jobs_file_path, compiler_name=None, optimize=False):
+        with open(jobs_file_path, 'r') as file_handle:
+            job_entries = json.load(file_handle)
+
+        jobs_folder_path = os.path.dirname(os.path.abspath(jobs_file_path))
+
+        def resolve(path):
+            return os.path.join(jobs_folder_path, path) if path else path
+
+        return [VisualCompileJob(resolve(job_entry['segments']),
+                                 resolve(job_entry['vars']),
+                                 resolve(job_entry.get('output')),
+                                 job_entry.get('compiler', compiler_name),
+                                 job_entry.get('optimize', optimize))
+                for job_entry in job_entries]
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def run(self, write=True):
+        # Returns {'output', 'unresolved', 'invalid', 'error', 'seconds'}, errors are
+        # reported instead of raised so one broken theme doesn't stop the batch.
+        result = {'segments': self.segments_path,
+                  'output': self.output_path,
+                  'unresolved': [],
+                  'invalid': [],
+                  'error': None,
+                  'seconds': 0.0}
+
+        start_time = clock()
+
+        try:
+            output_path = self.output_path if write else None
+
+            if output_path:
+                output_folder_path = os.path.dirname(output_path)
+
+                if output_folder_path and not os.path.isdir(output_folder_path):
+                    os.makedirs(output_folder_path)
+
+            # Compilers that write the output themselves are given its path.
+            compiler_type = self.load_compiler(self.compiler_name)
+            content = VisualCompilerBase.call_compile(compiler_type.compile, self.segments_path, self.vars_path,
+                                                      output_path, unresolved=result['unresolved'],
+                                                      invalid=result['invalid'])
+
+            if self.optimize:
+                content = VisualQssOptimizer.optimize(content)
+
+            if output_path:
+                compiler_type.write_output(content, output_path)
+        except Exception:
+            result['error'] = traceback.format_exc()
+
+        result['seconds'] = clock() - start_time
+        return result
+
+
+# *********************************************************************
+# +++ FUNCTIONS
+# *********************************************************************
+def _run_job(job_and_write):
+    # Module level so the pool can pickle it.
+    job, write = job_and_write
+    return job.run(write)
+
+
+def run_jobs(jobs, processes=None, write=True):
+    job_arguments = [(job, write) for job in jobs]
+
+    if processes == 1 or len(jobs) < 2:
+        return [_run_job(job_argument) for job_argument in job_arguments]
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        return pool.map(_run_job, job_arguments, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='qss-compile', description='Compile segmented qss with variables.')
+    parser.add_argument('--job', nargs=3, action='append', default=[], metavar=('SEGMENTS', 'VARS', 'OUTPUT'),
+                        help='Segments folder, vars folder and output file, can be repeated.')
+    parser.add_argument('--jobs-file', help='Json file listing the jobs.')
+    parser.add_argument('--compiler', help='Compiler class as package.module:Class.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Worker processes, defaults to the number of cores.')
+    parser.add_argument('--check', action='store_true',
+                        help="Don't write anything, exit with 1 if a variable can't be resolved.")
+    parser.add_argument('--optimize', action='store_true',
+                        help='Minify and merge the rules of the compiled style sheets.')
+    arguments = parser.parse_args(arguments)
+
+    jobs = [VisualCompileJob(segments_path, vars_path, output_path, arguments.compiler, arguments.optimize)
+            for segments_path, vars_path, output_path in arguments.job]
+
+    if arguments.jobs_file:
+        jobs += VisualCompileJob.load_jobs(arguments.jobs_file, arguments.compiler, arguments.optimize)
+
+    if not jobs:
+        parser.error('no jobs, use --job or --jobs-file')
+
+    start_time = clock()
+    results = run_jobs(jobs, arguments.processes, write=not arguments.check)
+
+    failed = False
+    for result in results:
+        name = result['output'] or result['segments']
+
+        if result['error']:
+            failed = True
+            sys.stderr.write('FAILED {}\n{}\n'.format(name, result['error']))
+            continue
+
+        for variable_name in result['invalid']:
+            sys.stderr.write('{}: invalid variable name {}\n'.format(name, variable_name))
+
+        for reference in result['unresolved']:
+            sys.stderr.write('{}: unresolved variable {}\n'.format(name, reference))
+
+        if arguments.check and result['unresolved']:
+            failed = True
+
+        sys.stdout.write('{} {} ({:.1f} ms)\n'.format('checked' if arguments.check else 'compiled',
+                                                      name, result['seconds'] * 1000.0))
+
+    sys.stdout.write('{} jobs in {:.2f} s\n'.format(len(results), clock() - start_time))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
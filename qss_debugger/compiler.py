@@ -3,46 +3,860 @@
 # *********************************************************************
 import os
 import re
+import time
+import bisect
+import inspect
+import operator
+import hashlib
+import tempfile
 from future.utils import iteritems
 
 
+# *********************************************************************
+# +++ CONSTANTS
+# *********************************************************************
+# Durations are measured with the highest resolution clock available.
+clock = getattr(time, 'perf_counter', time.time)
+
+
 # *********************************************************************
 # +++ CLASS
 # *********************************************************************
 class VisualCompilerBase(object):
+    # compile() returns the compiled style sheet, the output file is only written
+    # when a path is given. VERSION is part of the compile cache key, bump it
+    # whenever the same inputs would compile to a different output.
+    VERSION = 0
+
+    @staticmethod
+    def compile(qss_folder_path, qss_vars_folder_path, qss_out_file_path=None, segment_cache=None,
+                changed_paths=None, timings=None, unresolved=None, invalid=None):
+        raise NotImplementedError()
+
+    # Optional, compiles the segments once into a template that every variant
+    # (vars folder) is rendered from.
     @staticmethod
-    def compile(qss_folder_path, qss_vars_folder_path, qss_out_file_path):
+    def compile_template(qss_folder_path, segment_cache=None, changed_paths=None, timings=None, template=None):
         raise NotImplementedError()
 
+    @staticmethod
+    def render(template, qss_vars_folder_path, qss_out_file_path=None, timings=None, unresolved=None,
+               invalid=None):
+        raise NotImplementedError()
+
+    @staticmethod
+    def write_output(content, output_file_path):
+        with open(output_file_path, "w") as output_file:
+            output_file.write(content)
+
+    # Keyword arguments were added to these methods over time, compilers written
+    # before only get the ones their overrides accept.
+    @staticmethod
+    def _accepted_keywords(function):
+        # None when any keyword is accepted.
+        try:
+            signature = inspect.signature(function)
+        except AttributeError:
+            arg_spec = inspect.getargspec(function)
+            return None if arg_spec.keywords else set(arg_spec.args)
+        except (TypeError, ValueError):
+            return None
+
+        parameters = list(signature.parameters.values())
+
+        if any([parameter.kind == parameter.VAR_KEYWORD for parameter in parameters]):
+            return None
+
+        return set([parameter.name for parameter in parameters
+                    if parameter.kind in (parameter.POSITIONAL_OR_KEYWORD, parameter.KEYWORD_ONLY)])
+
+    @staticmethod
+    def _requires_output_path(function):
+        # compile() of the first API takes the output file path without a default.
+        try:
+            signature = inspect.signature(function)
+        except AttributeError:
+            arg_spec = inspect.getargspec(function)
+            return len(arg_spec.args) - len(arg_spec.defaults or ()) >= 3
+        except (TypeError, ValueError):
+            return False
+
+        parameters = [parameter for parameter in signature.parameters.values()
+                      if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)]
+
+        return len(parameters) >= 3 and parameters[2].default is parameters[2].empty
+
+    @staticmethod
+    def call(function, *args, **kwargs):
+        accepted_keywords = VisualCompilerBase._accepted_keywords(function)
+
+        if accepted_keywords is not None:
+            kwargs = dict([(name, value) for name, value in iteritems(kwargs) if name in accepted_keywords])
+
+        return function(*args, **kwargs)
+
+    @staticmethod
+    def call_compile(compile_function, qss_folder_path, qss_vars_folder_path, qss_out_file_path=None, **kwargs):
+        # Compilers of the first API write the output file themselves and may return
+        # None, it's then read back. Without qss_out_file_path they write to a
+        # temporary file.
+        if not VisualCompilerBase._requires_output_path(compile_function):
+            return VisualCompilerBase.call(compile_function, qss_folder_path, qss_vars_folder_path, **kwargs)
+
+        temporary_file_path = None
+
+        if not qss_out_file_path:
+            file_handle, temporary_file_path = tempfile.mkstemp(suffix='.qss')
+            os.close(file_handle)
+            qss_out_file_path = temporary_file_path
+
+        try:
+            content = VisualCompilerBase.call(compile_function, qss_folder_path, qss_vars_folder_path,
+                                              qss_out_file_path, **kwargs)
+
+            if content is None:
+                with open(qss_out_file_path, 'r') as file_handle:
+                    content = file_handle.read()
+        finally:
+            if temporary_file_path is not None:
+                os.remove(temporary_file_path)
+
+        return content
+
+    @staticmethod
+    def supports_template(compiler_type):
+        # A subclass overriding compile() but inheriting compile_template() and
+        # render() expects its compile() to be used.
+        def defining_type(name):
+            for base_type in inspect.getmro(compiler_type):
+                if name in vars(base_type):
+                    return base_type
+
+        template_type = defining_type('compile_template')
+        render_type = defining_type('render')
+        compile_type = defining_type('compile') or object
+
+        if template_type in (None, VisualCompilerBase) or render_type in (None, VisualCompilerBase):
+            return False
+
+        return issubclass(template_type, compile_type) and issubclass(render_type, compile_type)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualSegment(object):
+    __slots__ = ('path', 'mtime', 'size', 'digest', 'content')
+
+    def __init__(self, path, mtime, size, digest, content):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+        self.content = content
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualSegmentCache(object):
+    # Keeps the segments of a folder between compilations so only the files whose
+    # (mtime, size, content hash) changed are read again.
+    SEGMENT_EXTENSIONS = ('.css', '.qss')
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self):
+        self._folder_path = None
+        self._segments = {}
+        self._order = []
+        self._output = None
+        self._segment_lines = []
+
+        # Template compiled from the segments, kept so the next compile only splits
+        # the segments that changed.
+        self.template = None
+
+        self.hits = 0
+        self.misses = 0
+        self.last_hits = 0
+        self.last_misses = 0
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def list_segments(folder_path):
+        # os.listdir order is arbitrary, segments are always concatenated by name.
+        folder_path = os.path.normpath(folder_path)
+        return [os.path.join(folder_path, file_name)
+                for file_name in sorted(os.listdir(folder_path))
+                if os.path.splitext(file_name)[1] in VisualSegmentCache.SEGMENT_EXTENSIONS]
+
+    @staticmethod
+    def read_segment(file_path):
+        with open(file_path, 'r') as file_handle:
+            content = file_handle.read()
+
+        file_stat = os.stat(file_path)
+        digest = hashlib.md5(content.encode('utf-8')).hexdigest()
+        return VisualSegment(file_path, file_stat.st_mtime, file_stat.st_size, digest, content)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def segments(self):
+        return [self._segments[path] for path in self._order]
+
+    @property
+    def output(self):
+        return self._output
+
+    @property
+    def segment_lines(self):
+        # [(first line in the output, segment file name)] in output order.
+        return list(self._segment_lines)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def clear(self):
+        self._folder_path = None
+        self._segments = {}
+        self._order = []
+        self._output = None
+        self._segment_lines = []
+        self.template = None
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.last_hits = 0
+        self.last_misses = 0
+
+    def update(self, folder_path, changed_paths=None):
+        if folder_path != self._folder_path:
+            self.clear()
+            self._folder_path = folder_path
+
+        # When the caller knows which files changed only those are checked, the
+        # folder is listed again only if a segment may have been added or removed.
+        if changed_paths is not None and self._output is not None:
+            changed_paths = [file_path for file_path in changed_paths
+                             if os.path.splitext(file_path)[1] in self.SEGMENT_EXTENSIONS]
+
+            if all(file_path in self._segments and os.path.isfile(file_path) for file_path in changed_paths):
+                order = self._order
+                check_paths = changed_paths
+            else:
+                order = self.list_segments(folder_path)
+                check_paths = [file_path for file_path in order
+                               if file_path in changed_paths or file_path not in self._segments]
+        else:
+            order = self.list_segments(folder_path)
+            check_paths = order
+
+        dirty = order != self._order
+        hits = len(order) - len(check_paths)
+        misses = 0
+
+        # A file reported as changed is always hashed again, a save of the same size
+        # within the mtime resolution doesn't change its stat.
+        reported_paths = set(changed_paths or [])
+
+        for file_path in check_paths:
+            segment = self._segments.get(file_path)
+
+            if segment and file_path not in reported_paths:
+                file_stat = os.stat(file_path)
+
+                if segment.mtime == file_stat.st_mtime and segment.size == file_stat.st_size:
+                    hits += 1
+                    continue
+
+            new_segment = self.read_segment(file_path)
+
+            if segment and segment.digest == new_segment.digest:
+                # Touched but not modified, keep the cached content.
+                segment.mtime = new_segment.mtime
+                segment.size = new_segment.size
+                hits += 1
+                continue
+
+            self._segments[file_path] = new_segment
+            misses += 1
+            dirty = True
+
+        for file_path in set(self._segments) - set(order):
+            del self._segments[file_path]
+
+        self._order = order
+
+        if dirty or self._output is None:
+            self._output = ''.join([self._segments[path].content + '\n' for path in order])
+            self._segment_lines = []
+
+            first_line = 1
+            for path in order:
+                self._segment_lines.append((first_line, os.path.basename(path)))
+                first_line += self._segments[path].content.count('\n') + 1
+
+        self.last_hits = hits
+        self.last_misses = misses
+        self.hits += hits
+        self.misses += misses
+
+        return self._output
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualVarsTable(object):
+    # Resolves variable references in a single pass: the stylesheet is split into
+    # name tokens once and every token is looked up in a precompiled table, so
+    # a variable only ever matches a whole name and never inside another one.
+    # Values can reference other variables (@accent: @blue), they are resolved
+    # when the table is built, variables in a reference cycle stay unresolved.
+    MODE_EXACT = 'exact'
+    MODE_PREFIX = 'prefix'
+
+    REFERENCE_PREFIXES = '@$'
+    NAME_PATTERN = re.compile(r'[@$]?[A-Za-z_][\w-]*$')
+
+    TOKEN_PATTERNS = {
+        MODE_EXACT: re.compile(r'(?<![\w@$-])([@$]?[A-Za-z_][\w-]*)'),
+        MODE_PREFIX: re.compile(r'(?<![\w@$-])([@$][A-Za-z_][\w-]*)'),
+    }
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, vars_map, mode=None, case_sensitive=False):
+        self._case_sensitive = case_sensitive
+        self._lookup = {}
+        self._dependencies = {}
+        self._dependents = {}
+        self.unresolved = []
+        self.cycles = []
+        self.invalid_names = []
+
+        for key, value in iteritems(vars_map):
+            if not self.NAME_PATTERN.match(key):
+                self.invalid_names.append(key)
+                continue
+
+            self._lookup[self.key(key)] = value
+
+        self._resolve_references()
+
+        # Prefix mode only looks at @name/$name tokens, which is faster and lets
+        # unknown references be reported. It is used whenever every name has a prefix.
+        if mode is None:
+            prefixed = all(key[0] in self.REFERENCE_PREFIXES for key in self._lookup)
+            mode = self.MODE_PREFIX if prefixed else self.MODE_EXACT
+
+        self._mode = mode
+        self._token_pattern = self.TOKEN_PATTERNS[mode]
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _resolve_references(self):
+        reference_pattern = self.TOKEN_PATTERNS[self.MODE_PREFIX]
+
+        for key, value in iteritems(self._lookup):
+            references = [self.key(reference) for reference in reference_pattern.findall(value)]
+            references = [reference for reference in references if reference in self._lookup]
+
+            if references:
+                self._dependencies[key] = sorted(set(references))
+
+                for reference in self._dependencies[key]:
+                    self._dependents.setdefault(reference, []).append(key)
+
+        resolved = set()
+        broken = set()
+
+        # Depth first, the references of a variable are resolved before it.
+        def visit(key, stack):
+            if key in resolved or key in broken:
+                return
+
+            if key in stack:
+                cycle = stack[stack.index(key):] + [key]
+                self.cycles.append(cycle)
+                broken.update(cycle)
+                return
+
+            stack.append(key)
+            for reference in self._dependencies.get(key, []):
+                visit(reference, stack)
+            stack.pop()
+
+            if key in broken:
+                return
+
+            if any(reference in broken for reference in self._dependencies.get(key, [])):
+                broken.add(key)
+                return
+
+            if key in self._dependencies:
+                self._lookup[key] = reference_pattern.sub(
+                    lambda match: self._lookup.get(self.key(match.group(1)), match.group(1)), self._lookup[key])
+
+            resolved.add(key)
+
+        for key in sorted(self._dependencies):
+            visit(key, [])
+
+        for key in broken:
+            del self._lookup[key]
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def names(self):
+        return sorted(self._lookup)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def key(self, name):
+        return name if self._case_sensitive else name.lower()
+
+    def resolve(self, name):
+        return self._lookup.get(name if self._case_sensitive else name.lower())
+
+    def dependencies(self, name):
+        # Variables referenced by the value of name.
+        return list(self._dependencies.get(self.key(name), []))
+
+    def dependents(self, name):
+        # Every variable whose value depends on name, directly or not.
+        dependents = []
+        pending = list(self._dependents.get(self.key(name), []))
+
+        while pending:
+            dependent = pending.pop()
+
+            if dependent not in dependents:
+                dependents.append(dependent)
+                pending.extend(self._dependents.get(dependent, []))
+
+        return sorted(dependents)
+
+    def substitute(self, content):
+        lookup = self._lookup
+        prefixes = self.REFERENCE_PREFIXES
+
+        # Even positions hold the text between names, odd positions the names.
+        parts = self._token_pattern.split(content)
+        tokens = parts[1::2]
+        keys = tokens if self._case_sensitive else [token.lower() for token in tokens]
+        values = [lookup.get(key) for key in keys]
+
+        self.unresolved = sorted(set([token for token, value in zip(tokens, values)
+                                      if value is None and token[0] in prefixes]))
+
+        parts[1::2] = [token if value is None else value for token, value in zip(tokens, values)]
+        return ''.join(parts)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualTemplateSegment(object):
+    # One segment of a template. It is split and rendered on its own, a changed
+    # segment is the only one split again.
+    __slots__ = ('key', 'content', 'line_count', 'splits', 'slot_lines', 'rendered')
+
+    def __init__(self, key, content):
+        self.key = key
+        self.content = content
+        self.line_count = content.count('\n')
+
+        # {mode: (parts, {name: [part indices]})}, {mode: {name: [lines]}} and
+        # {mode: [rendered parts, rendered text]}.
+        self.splits = {}
+        self.slot_lines = {}
+        self.rendered = {}
+
+    def split(self, mode):
+        split = self.splits.get(mode)
+
+        if split is None:
+            # Even positions hold the static text, odd positions the slots.
+            parts = VisualVarsTable.TOKEN_PATTERNS[mode].split(self.content)
+            slots = {}
+
+            for index in range(1, len(parts), 2):
+                slots.setdefault(parts[index], []).append(index)
+
+            split = self.splits[mode] = (parts, slots)
+
+        return split
+
+    def lines(self, mode):
+        # {name: [line of every reference in the segment]}, lines start at 1.
+        slot_lines = self.slot_lines.get(mode)
+
+        if slot_lines is None:
+            parts, slots = self.split(mode)
+            part_lines = [1] * len(parts)
+
+            line = 1
+            for index, part in enumerate(parts):
+                part_lines[index] = line
+                line += part.count('\n')
+
+            slot_lines = self.slot_lines[mode] = dict([(name, [part_lines[index] for index in indices])
+                                                       for name, indices in iteritems(slots)])
+
+        return slot_lines
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssTemplate(object):
+    # Compiled segments split into static text and variable slots, segment by
+    # segment. The split depends on the vars table mode, it is done the first
+    # time a table of that mode is rendered and reused afterwards. The rendered
+    # parts are kept too, rendering again only rewrites the slots of the names
+    # whose value changed and joins again the segments that use them. update()
+    # keeps the split and rendered parts of the segments that didn't change.
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, segments=None):
+        self._segments = []
+
+        # {mode: {name: value}} of the last render, a slot holds the name itself
+        # until it resolves to something else.
+        self._values = {}
+        self._names = {}
+        self._slot_lines = {}
+
+        self.last_vars_table = None
+        self.last_changed_names = []
+
+        self.update(segments or [])
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _mode_names(self, mode):
+        names = self._names.get(mode)
+
+        if names is None:
+            names = self._names[mode] = set()
+
+            for segment in self._segments:
+                names.update(segment.split(mode)[1])
+
+        return names
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def content(self):
+        return ''.join([segment.content for segment in self._segments])
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def update(self, segments):
+        # segments is [(key, content)] in output order, the key identifies the
+        # content (the path and hash of a segment file) or is None to use the
+        # content itself. Returns whether any segment changed.
+        current_segments = dict([(segment.key, segment) for segment in self._segments])
+        new_segments = []
+
+        for key, content in segments:
+            key = content if key is None else key
+            segment = current_segments.get(key)
+            new_segments.append(segment if segment is not None else VisualTemplateSegment(key, content))
+
+        if len(new_segments) == len(self._segments) and all(map(operator.is_, new_segments, self._segments)):
+            return False
+
+        self._segments = new_segments
+        self._names = {}
+        self._slot_lines = {}
+        return True
+
+    def names(self, mode=VisualVarsTable.MODE_PREFIX):
+        return sorted(self._mode_names(mode))
+
+    def slot_lines(self, mode=VisualVarsTable.MODE_PREFIX):
+        # {name: [line of every reference in the content]}, lines start at 1.
+        slot_lines = self._slot_lines.get(mode)
+
+        if slot_lines is None:
+            slot_lines = self._slot_lines[mode] = {}
+
+            first_line = 1
+            for segment in self._segments:
+                for name, lines in iteritems(segment.lines(mode)):
+                    slot_lines.setdefault(name, []).extend([first_line + line - 1 for line in lines])
+
+                first_line += segment.line_count
+
+        return slot_lines
+
+    def output_ranges(self, name, mode=VisualVarsTable.MODE_PREFIX):
+        # [(start, end)] offsets of the slots of name in the last rendered output.
+        ranges = []
+
+        offset = 0
+        for segment in self._segments:
+            rendered = segment.rendered.get(mode)
+
+            if rendered is None:
+                return []
+
+            rendered_parts, rendered_text = rendered
+            indices = segment.split(mode)[1].get(name)
+
+            if indices:
+                indices = set(indices)
+                part_offset = offset
+
+                for index, part in enumerate(rendered_parts):
+                    if index in indices:
+                        ranges.append((part_offset, part_offset + len(part)))
+                    part_offset += len(part)
+
+            offset += len(rendered_text)
+
+        return ranges
+
+    def render(self, vars_table, unresolved=None):
+        mode = vars_table.mode
+        values = self._values.get(mode, {})
+        new_values = {}
+        unresolved_names = []
+
+        for name in self._mode_names(mode):
+            value = vars_table.resolve(name)
+
+            if value is None:
+                if name[0] in VisualVarsTable.REFERENCE_PREFIXES:
+                    unresolved_names.append(name)
+                value = name
+
+            new_values[name] = value
+
+        changed_names = [name for name, value in iteritems(new_values) if values.get(name, name) != value]
+        self._values[mode] = new_values
+
+        for segment in self._segments:
+            parts, slots = segment.split(mode)
+            rendered = segment.rendered.get(mode)
+
+            if rendered is None:
+                # New segment, every slot is filled.
+                rendered_parts = list(parts)
+                segment_names = slots
+                rendered = segment.rendered[mode] = [rendered_parts, None]
+            else:
+                rendered_parts = rendered[0]
+                segment_names = [name for name in changed_names if name in slots]
+
+                if not segment_names:
+                    continue
+
+            for name in segment_names:
+                value = new_values[name]
+
+                for index in slots[name]:
+                    rendered_parts[index] = value
+
+            rendered[1] = ''.join(rendered_parts)
+
+        if unresolved is not None:
+            unresolved.extend(sorted(unresolved_names))
+
+        self.last_vars_table = vars_table
+        self.last_changed_names = sorted(changed_names)
+
+        return ''.join([segment.rendered[mode][1] for segment in self._segments])
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualVarsIndex(object):
+    # Where every variable is used: the segment and line of each reference, the
+    # variables it is defined with and the variables defined with it.
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, template, vars_table, segment_lines=None):
+        self._vars_table = vars_table
+        self._segment_lines = segment_lines or []
+        self._segment_first_lines = [first_line for first_line, _ in self._segment_lines]
+
+        # Keyed like the table, so references in another case are merged.
+        self._references = {}
+        for name, lines in iteritems(template.slot_lines(vars_table.mode)):
+            self._references.setdefault(vars_table.key(name), []).extend(lines)
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _location(self, line):
+        # (segment name, line in the segment) of a line of the content.
+        position = bisect.bisect_right(self._segment_first_lines, line) - 1
+
+        if position < 0:
+            return None, line
+
+        first_line, segment = self._segment_lines[position]
+        return segment, line - first_line + 1
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def names(self):
+        return self._vars_table.names
+
+    @property
+    def cycles(self):
+        return list(self._vars_table.cycles)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def value(self, name):
+        return self._vars_table.resolve(name)
+
+    def dependencies(self, name):
+        return self._vars_table.dependencies(name)
+
+    def dependents(self, name):
+        return self._vars_table.dependents(name)
+
+    def locations(self, name, indirect=False):
+        # [(segment name, line)] of the references to name, indirect adds the
+        # references to the variables defined with it.
+        names = [self._vars_table.key(name)]
+
+        if indirect:
+            names += self.dependents(name)
+
+        lines = sorted(set([line for reference in names for line in self._references.get(reference, [])]))
+        return [self._location(line) for line in lines]
+
+    def affected_segments(self, names):
+        # Segments that render differently when the given variables change.
+        segments = set()
+
+        for name in names:
+            segments.update([segment for segment, _ in self.locations(name, indirect=True)])
+
+        return sorted(segments)
+
 
 # *********************************************************************
 # +++ CLASS
 # *********************************************************************
 class VisualCompilerDefault(VisualCompilerBase):
+    VERSION = 2
+
     @staticmethod
-    def compile(qss_folder_path, qss_vars_folder_path, qss_out_file_path):
-        VisualCompilerDefault._compile_qss(qss_folder_path, qss_out_file_path)
-        VisualCompilerDefault._inject_vars(qss_out_file_path, qss_vars_folder_path)
+    def compile(qss_folder_path, qss_vars_folder_path, qss_out_file_path=None, segment_cache=None,
+                changed_paths=None, timings=None, unresolved=None, invalid=None):
+        # timings, when given, receives the duration in seconds of every stage,
+        # unresolved the variable references that were not found and invalid the
+        # variable names that were ignored. Both are printed when not given.
+        template = VisualCompilerDefault.compile_template(qss_folder_path, segment_cache, changed_paths, timings)
+        return VisualCompilerDefault.render(template, qss_vars_folder_path, qss_out_file_path, timings, unresolved,
+                                            invalid)
 
     @staticmethod
-    def _compile_qss(input_folder_path, output_file_path):
-        result = ''
-        for file_name in os.listdir(input_folder_path):
-            file_path = os.path.join(input_folder_path, file_name)
-            extension = os.path.splitext(file_name)[1]
+    def compile_template(qss_folder_path, segment_cache=None, changed_paths=None, timings=None, template=None):
+        # The given template, or the one kept by segment_cache, is updated: only the
+        # segments that changed are split and rendered again.
+        timings = timings if timings is not None else {}
 
-            if extension in ['.css', '.qss']:
-                with open(file_path, 'r') as file_handle:
-                    result += file_handle.read() + '\n'
+        start_time = clock()
 
-        with open(output_file_path, "w") as output_file:
-            output_file.write(result)
+        if segment_cache is not None:
+            segment_cache.update(qss_folder_path, changed_paths)
+            segments = [((segment.path, segment.digest), segment.content + '\n') for segment in segment_cache.segments]
+            template = template or segment_cache.template
+        else:
+            segments = [(None, VisualCompilerDefault._compile_qss(qss_folder_path))]
+
+        if template is None:
+            template = VisualQssTemplate(segments)
+        else:
+            template.update(segments)
+
+        if segment_cache is not None:
+            segment_cache.template = template
+
+        timings['compile'] = clock() - start_time
+        return template
+
+    @staticmethod
+    def render(template, qss_vars_folder_path, qss_out_file_path=None, timings=None, unresolved=None,
+               invalid=None):
+        timings = timings if timings is not None else {}
+
+        start_time = clock()
+        vars_table = VisualVarsTable(VisualCompilerDefault._read_vars(qss_vars_folder_path))
+        unresolved_names = []
+        content = template.render(vars_table, unresolved_names)
+        timings['inject'] = clock() - start_time
+
+        if unresolved is not None:
+            unresolved.extend(unresolved_names)
+        else:
+            for reference in unresolved_names:
+                print('Unresolved variable {}'.format(reference))
+
+        if invalid is not None:
+            invalid.extend(vars_table.invalid_names)
+        else:
+            for name in vars_table.invalid_names:
+                print('Invalid variable name {}'.format(name))
+
+        if qss_out_file_path:
+            VisualCompilerDefault.write_output(content, qss_out_file_path)
+
+        return content
+
+    @staticmethod
+    def _compile_qss(input_folder_path, segment_cache=None, changed_paths=None):
+        if segment_cache is not None:
+            return segment_cache.update(input_folder_path, changed_paths)
+
+        result = ''
+        for file_path in VisualSegmentCache.list_segments(input_folder_path):
+            with open(file_path, 'r') as file_handle:
+                result += file_handle.read() + '\n'
+
+        return result
 
     @staticmethod
-    def _inject_vars(input_file_path, vars_path):
+    def _read_vars(vars_path):
         vars_map = {}
 
-        for file_name in os.listdir(vars_path):
+        for file_name in sorted(os.listdir(vars_path)):
             file_path = os.path.join(vars_path, file_name)
 
             with open(file_path, 'r') as file_handle:
@@ -56,12 +870,4 @@ class VisualCompilerDefault(VisualCompilerBase):
                     else:
                         print('Error in line {} from file {}'.format(line, file_name))
 
-        with open(input_file_path, 'r') as file_handle:
-            content = file_handle.read()
-
-            for key, value in iteritems(vars_map):
-                re_value = re.compile(key, re.IGNORECASE)
-                content = re_value.sub(value, content)
-
-        with open(input_file_path, 'w') as file_handle:
-            file_handle.write(content)
+        return vars_map
@@ -15,154 +15,208 @@
 # *********************************************************************
 # +++ IMPORTS
 # *********************************************************************
-import os
-
 from Qt import QtGui, QtCore, QtWidgets
 
-from qss_debugger.explorer import VisualTreeExplorer
 from qss_debugger.painter import VisualTreePainter
-from qss_debugger.compiler import VisualCompilerDefault
+from qss_debugger.profiler import clock
+from qss_debugger.styler import VisualStyleApplier
+from qss_debugger.events import VisualTreeEventFilter
+from qss_debugger.service import VisualDebuggerService
+from qss_debugger.spatial import VisualSpatialIndex
+from qss_debugger.snapshot import VisualLayoutSnapshot
 
 
 # *********************************************************************
 # +++ CLASSES
 # *********************************************************************
-class VisualTreeEventFilter(QtCore.QObject):
-    # =====================================================================
-    # +++ SIGNALS
-    # =====================================================================
-    event_triggered = QtCore.Signal(QtCore.QObject, QtCore.QEvent)
-
-    # =====================================================================
-    # +++ CONSTRUCTOR
-    # =====================================================================
-    def __init__(self, parent=None):
-        super(VisualTreeEventFilter, self).__init__(parent)
-
-    # =====================================================================
-    # +++ OVERRIDES
-    # =====================================================================
-    def eventFilter(self, obj, event):
-        self.event_triggered.emit(obj, event)
-        return False
+class VisualTreeDebugger(QtWidgets.QWidget):
+    # Attaches a window to the application's VisualDebuggerService, which watches,
+    # compiles and owns the explorer. Only the overlay, picking and the style
+    # applied to this window are kept here, a new window adds no watcher or build.
+    LAYOUT_CHANGES_TIME = 3000
 
+    # Changed widget count and the seconds spent capturing and comparing.
+    layout_compared = QtCore.Signal(int, float)
 
-# *********************************************************************
-# +++ CLASSES
-# *********************************************************************
-class VisualTreeDebugger(QtWidgets.QWidget):
     # =====================================================================
     # +++ CONSTRUCTOR
     # =====================================================================
-    def __init__(self, parent=None, compiler_type=None):
+    def __init__(self, parent=None, compiler_type=None, debounce_interval=100, compile_cache_size=32 * 1024 * 1024,
+                 service=None):
         super(VisualTreeDebugger, self).__init__(parent)
-        # -- Compiler
-        self._compiler_type = compiler_type if compiler_type else VisualCompilerDefault
-
-        # -- Explorer
-        self._explorer = VisualTreeExplorer()
-        self._explorer.selection_changed.connect(self._selection_changed)
-        self._explorer.update_style_requested.connect(self._update_style)
-        self._explorer.closing.connect(self._save_settings)
-        self._explorer.show()
-
-        self._explorer.update_tree(parent)
-
-        self._file_watch_timer = QtCore.QTimer(self)
-        self._file_watch_timer.timeout.connect(self._update_monitor)
-        self._file_watch_timer.start(500)
-
-        self._css_last_mod_time = None
-        self._vars_last_mod_time = None
-
-        QtCore.QTimer.singleShot(0, self._update_explorer_geometry)
+        self._root = parent
+        self._style_applier = VisualStyleApplier(parent)
 
         # -- Painter
         self._painter = VisualTreePainter(parent)
+        self._selected_items = []
+        self._hovered_item = None
+
+        # -- Picking
+        # Used by hover pick, the index watches the widgets from the first query
+        # until stop_picking is called.
+        self._spatial_index = VisualSpatialIndex(parent, [self, self._painter], self)
+
+        # -- Layout Changes
+        # Captured before a style sheet is applied and compared once it's laid out,
+        # the changed widgets stay outlined for LAYOUT_CHANGES_TIME.
+        self._layout_snapshot = None
+        self._layout_time = 0.0
+
+        self._layout_timer = QtCore.QTimer(self)
+        self._layout_timer.setSingleShot(True)
+        self._layout_timer.setInterval(0)
+        self._layout_timer.timeout.connect(self._compare_layout)
+
+        self._layout_changes_timer = QtCore.QTimer(self)
+        self._layout_changes_timer.setSingleShot(True)
+        self._layout_changes_timer.setInterval(self.LAYOUT_CHANGES_TIME)
+        self._layout_changes_timer.timeout.connect(self.clear_layout_changes)
 
         # -- Event Filter
-        self._event_filter = VisualTreeEventFilter(self)
-        self._event_filter.event_triggered.connect(self._event_triggered)
+        self._event_filter = VisualTreeEventFilter(self, {QtCore.QEvent.Move: self._parent_geometry_changed,
+                                                          QtCore.QEvent.Resize: self._parent_geometry_changed,
+                                                          QtCore.QEvent.WindowTitleChange: self._title_changed,
+                                                          QtCore.QEvent.KeyPress: self._key_pressed})
         self.parent().installEventFilter(self._event_filter)
 
-        # -- Settings
-        parent_application_name = QtCore.QCoreApplication.applicationName()
-        self._settings = QtCore.QSettings('qssDebugger', parent_application_name)
-        self._load_settings()
+        # -- Service
+        # The arguments only apply when this is the first window of the application.
+        self._service = service or VisualDebuggerService.instance(compiler_type, debounce_interval,
+                                                                  compile_cache_size)
+        self._service.attach(self)
+
+        QtCore.QTimer.singleShot(0, lambda: self._service.update_explorer_geometry(self))
 
     # ====================================================================
     # +++ PRIVATE METHODS
     # =====================================================================
-    def _load_settings(self):
-        self._explorer.watch_css_folder_path = self._settings.value('watch_css_path')
-        self._explorer.watch_vars_folder_path = self._settings.value('watch_vars_path')
-        self._explorer.compiled_file_path = self._settings.value('compiled_css_path')
-
-    def _save_settings(self):
-        if self._explorer.is_settings_valid:
-            self._settings.setValue('watch_css_path', self._explorer.watch_css_folder_path)
-            self._settings.setValue('watch_vars_path', self._explorer.watch_vars_folder_path)
-            self._settings.setValue('compiled_css_path', self._explorer.compiled_file_path)
-
-    def _update_style(self, style_file_path=None):
-        if not style_file_path:
-            style_file_path = self._explorer.compiled_file_path
+    def _update_painter(self):
+        self._painter.current_items = [self._hovered_item] if self._hovered_item else self._selected_items
 
-        with open(style_file_path, 'r') as file_handle:
-            result = file_handle.read()
+    def _capture_layout(self):
+        return VisualLayoutSnapshot.capture(self._root, [self, self._painter])
 
-        self.parent().setStyleSheet(result)
+    def _compare_layout(self):
+        # Restyled widgets post layout requests, they are handled first so the
+        # snapshot has the final geometry.
+        QtCore.QCoreApplication.sendPostedEvents(None, QtCore.QEvent.LayoutRequest)
 
-    def _update_monitor(self):
-        if self._explorer.is_settings_valid:
+        start_time = clock()
+        layout_snapshot = self._capture_layout()
+        changed_rows = self._layout_snapshot.diff(layout_snapshot)
+        self._layout_time += clock() - start_time
+        self._layout_snapshot = None
 
-            if not self._css_last_mod_time:
-                self._css_last_mod_time = os.path.getmtime(self._explorer.watch_css_folder_path)
+        changed_rects = []
+        for row in changed_rows:
+            changed_rect = layout_snapshot.rect(row)
 
-            if not self._vars_last_mod_time:
-                self._vars_last_mod_time = os.path.getmtime(self._explorer.watch_vars_folder_path)
+            # Outlines are drawn one pixel wider than the rect, like QRect.bottomRight.
+            if not changed_rect.isEmpty() and layout_snapshot.widgets[row].isVisibleTo(self._root):
+                changed_rects.append(changed_rect.adjusted(0, 0, -1, -1))
 
-            css_current_mod_time = os.path.getmtime(self._explorer.watch_css_folder_path)
-            vars_current_mod_time = os.path.getmtime(self._explorer.watch_vars_folder_path)
+        self._painter.changed_rects = changed_rects
+        self._layout_changes_timer.start()
 
-            if self._css_last_mod_time != css_current_mod_time or \
-               self._vars_last_mod_time != vars_current_mod_time:
+        self.layout_compared.emit(len(changed_rows), self._layout_time)
 
-                self._explorer.log_message('Change detected, compiling...')
-                self._css_last_mod_time = None
-                self._vars_last_mod_time = None
+    def _parent_geometry_changed(self, obj, event):
+        self._service.update_explorer_geometry(self)
 
-                self._compiler_type.compile(self._explorer.watch_css_folder_path,
-                                            self._explorer.watch_vars_folder_path,
-                                            self._explorer.compiled_file_path)
+    def _title_changed(self, obj, event):
+        self._service.update_root_label(self)
 
-                self._update_style(self._explorer.compiled_file_path)
-                self._explorer.log_message('...done.')
-
-    def _update_explorer_geometry(self):
-        explorer_x = self.parent().geometry().x() + self.parent().geometry().width() + 12
-        explorer_y = self.parent().geometry().y()
-        explorer_width = self._explorer.geometry().width()
-        explorer_height = self.parent().geometry().height()
-        self._explorer.setGeometry(explorer_x, explorer_y, explorer_width, explorer_height)
-
-    def _event_triggered(self, obj, event):
-        if event.type() in [QtCore.QEvent.Move, QtCore.QEvent.Resize]:
-            self._update_explorer_geometry()
-
-        elif event.type() == QtCore.QEvent.KeyPress and event.key() == QtCore.Qt.Key_Insert:
+    def _key_pressed(self, obj, event):
+        if event.key() == QtCore.Qt.Key_Insert:
             mouse_pos = QtGui.QCursor.pos()
             mouse_pos = self.parent().mapFromGlobal(mouse_pos)
-            visual_item_hit = self.parent().childAt(mouse_pos)
+
+            # A single pick doesn't start watching the widgets.
+            if self._spatial_index.is_started:
+                visual_item_hit = self._spatial_index.widget_at(mouse_pos)
+            else:
+                visual_item_hit = self.parent().childAt(mouse_pos)
 
             if visual_item_hit:
-                self._explorer.set_selected_item(visual_item_hit)
+                self._service.select_item(self, visual_item_hit)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def root(self):
+        # Kept on the python side, still valid while the window is being destroyed.
+        return self._root
+
+    @property
+    def service(self):
+        return self._service
+
+    @property
+    def explorer(self):
+        return self._service.explorer
+
+    @property
+    def style_applier(self):
+        return self._style_applier
+
+    @property
+    def selected_items(self):
+        return self._selected_items
+
+    @selected_items.setter
+    def selected_items(self, value):
+        self._selected_items = value
+        self._update_painter()
+
+    @property
+    def hovered_item(self):
+        return self._hovered_item
+
+    @hovered_item.setter
+    def hovered_item(self, value):
+        if value is not self._hovered_item:
+            self._hovered_item = value
+            self._update_painter()
+
+    @property
+    def event_counters(self):
+        return self._event_filter.counters
+
+    @property
+    def rejected_event_count(self):
+        return self._event_filter.rejected_count
+
+    @property
+    def work_counters(self):
+        return self._service.work_counters
 
     # ====================================================================
-    # +++ CALLBACKS
+    # +++ PUBLIC METHODS
     # =====================================================================
-    def _selection_changed(self, visual_items):
-        self._painter.current_items = visual_items
+    def widget_at(self, pos):
+        return self._spatial_index.widget_at(pos)
+
+    def stop_picking(self):
+        self._spatial_index.stop()
+
+    def capture_layout(self):
+        # Called before a style sheet is applied, applies in a row are compared
+        # against the layout before the first one.
+        if self._layout_snapshot is not None or not self._root.isVisible():
+            return
+
+        start_time = clock()
+        self._layout_snapshot = self._capture_layout()
+        self._layout_time = clock() - start_time
+        self._layout_timer.start()
+
+    def clear_layout_changes(self):
+        self._layout_timer.stop()
+        self._layout_changes_timer.stop()
+        self._layout_snapshot = None
+        self._painter.changed_rects = []
 
 
 # ********************************************************************
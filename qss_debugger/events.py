@@ -0,0 +1,116 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+from future.utils import iteritems
+
+from Qt import QtCore
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualTreeEventFilter(QtCore.QObject):
+    # Filters run for every event the watched objects receive, the event type is
+    # looked up in the registration table and anything not registered is rejected
+    # right away. Handlers are called directly, returning True filters the event out.
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None, handlers=None):
+        super(VisualTreeEventFilter, self).__init__(parent)
+        self._handlers = {}
+        self._dispatched = {}
+
+        # Rejected events are only counted in total, per type when count_rejected
+        # is set, the path most events take stays a lookup and an addition.
+        self._rejected_count = 0
+        self._rejected = None
+
+        for event_type, handler in iteritems(handlers or {}):
+            self.register(event_type, handler)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def counters(self):
+        # {event type: dispatched count}
+        return dict(self._dispatched)
+
+    @property
+    def rejected_count(self):
+        return self._rejected_count
+
+    @property
+    def rejected_counters(self):
+        # {event type: rejected count}, empty unless count_rejected is set.
+        return dict(self._rejected or {})
+
+    @property
+    def count_rejected(self):
+        return self._rejected is not None
+
+    @count_rejected.setter
+    def count_rejected(self, value):
+        if value != self.count_rejected:
+            self._rejected = {} if value else None
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def register(self, event_type, handler):
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def unregister(self, event_type, handler=None):
+        handlers = self._handlers.get(event_type, [])
+
+        if handler in handlers:
+            handlers.remove(handler)
+
+        if handler is None or not handlers:
+            self._handlers.pop(event_type, None)
+
+    def reset_counters(self):
+        self._dispatched = {}
+        self._rejected_count = 0
+
+        if self._rejected is not None:
+            self._rejected = {}
+
+    # ====================================================================
+    # +++ OVERRIDES
+    # =====================================================================
+    def eventFilter(self, obj, event):
+        event_type = event.type()
+        handlers = self._handlers.get(event_type)
+
+        if handlers is None:
+            self._rejected_count += 1
+
+            if self._rejected is not None:
+                self._rejected[event_type] = self._rejected.get(event_type, 0) + 1
+
+            return False
+
+        self._dispatched[event_type] = self._dispatched.get(event_type, 0) + 1
+
+        for handler in handlers:
+            if handler(obj, event):
+                return True
+
+        return False
@@ -16,17 +16,23 @@
 # +++ IMPORTS
 # *********************************************************************
 import os
-import hashlib
 
 from future.utils import iteritems
 
 from Qt import QtGui, QtCore, QtWidgets
 
+from qss_debugger.log import VisualLog, LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR, LEVEL_NAMES
+from qss_debugger.model import VisualTreeModel, VisualTreeFilterModel
+from qss_debugger.search import VisualSearchIndex
+
 
 # *********************************************************************
 # +++ CLASS
 # *********************************************************************
 class VisualTreeExplorer(QtWidgets.QDialog):
+    SEARCH_INTERVAL = 150
+    SEARCH_RESULTS = 500
+
     # =====================================================================
     # +++ SIGNALS
     # =====================================================================
@@ -36,14 +42,43 @@ class VisualTreeExplorer(QtWidgets.QDialog):
 
     selection_changed = QtCore.Signal(list)
     update_style_requested = QtCore.Signal()
+    settings_changed = QtCore.Signal()
+    variant_selected = QtCore.Signal(str)
+    optimize_output_changed = QtCore.Signal()
+    apply_to_application_changed = QtCore.Signal()
+    hover_pick_changed = QtCore.Signal(bool)
+    highlight_layout_changes_changed = QtCore.Signal(bool)
+    root_selected = QtCore.Signal(object)
     closing = QtCore.Signal()
 
     # =====================================================================
     # +++ CONSTRUCTOR
     # =====================================================================
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, log_capacity=5000):
         super(VisualTreeExplorer, self).__init__(parent)
         self._validation_controls = {'folder_exists': [], 'file_exists': []}
+        self._validation_results = {}
+        self._validation_counters = {'validations': 0, 'validation_restyles': 0}
+
+        # Paths the variants were listed for, they are listed again when a path or
+        # the folder containing the variants changes.
+        self._variants_key = None
+        self._rule_index = None
+        self._profile_report = None
+        self._vars_index = None
+
+        # Built on the first search, kept up to date with the tree after that.
+        self._search_index = VisualSearchIndex(self)
+        self._search_index.changed.connect(self._search_index_changed)
+
+        self._log = VisualLog(self, log_capacity)
+        self._log.entries_added.connect(self._log_entries_added)
+
+        # Validation results are cached, they are only recomputed when a path changes
+        # or an entry appears/disappears in the folders containing the paths.
+        self._path_watcher = QtCore.QFileSystemWatcher(self)
+        self._path_watcher.fileChanged.connect(self._paths_changed)
+        self._path_watcher.directoryChanged.connect(self._paths_changed)
 
         self._init_ui()
         self._validate()
@@ -53,28 +88,103 @@ class VisualTreeExplorer(QtWidgets.QDialog):
     # =====================================================================
     def _init_ui(self):
         # -- Visual Tree Tab
-        self._debug_tree = QtWidgets.QTreeWidget()
+        self._tree_model = VisualTreeModel(self)
+        # Only set on the view while searching, browsing doesn't go through it.
+        self._tree_filter_model = VisualTreeFilterModel(self)
+
+        # Every debugged window shares this explorer, the tree shows the selected one.
+        # The roots are kept in _roots, item data can't hold a deleted window.
+        self._roots = []
+        self._root_widget = QtWidgets.QComboBox()
+        self._root_widget.activated.connect(self._root_activated)
+
+        # Typing restarts the timer, the tree is filtered once it pauses.
+        self._tree_search_widget = QtWidgets.QLineEdit()
+        self._tree_search_widget.setPlaceholderText('Search type, name, property or class...')
+        self._tree_search_widget.setToolTip('Terms can be limited to a field, e.g. type:qpushbutton '
+                                            'name:ok property:enabled=true class:primary')
+        self._tree_search_widget.textChanged.connect(lambda: self._tree_search_timer.start())
+
+        self._tree_search_timer = QtCore.QTimer(self)
+        self._tree_search_timer.setSingleShot(True)
+        self._tree_search_timer.setInterval(self.SEARCH_INTERVAL)
+        self._tree_search_timer.timeout.connect(self._search_tree)
+
+        self._tree_search_status_widget = QtWidgets.QLabel()
+        self._tree_search_status_widget.hide()
+
+        self._debug_tree = QtWidgets.QTreeView()
         self._debug_tree.setUniformRowHeights(True)
-        self._debug_tree.setColumnCount(2)
         self._debug_tree.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
-        self._debug_tree.itemSelectionChanged.connect(self._selection_changed)
+        self._set_debug_tree_model(self._tree_model)
+
+        self._rules_tree = QtWidgets.QTreeWidget()
+        self._rules_tree.setUniformRowHeights(True)
+        self._rules_tree.setHeaderLabels(['Matching Rule', 'Source', 'Specificity'])
+
+        debug_tree_layout = QtWidgets.QVBoxLayout()
+        debug_tree_layout.setContentsMargins(0, 0, 0, 0)
+        debug_tree_layout.addWidget(self._root_widget)
+        debug_tree_layout.addWidget(self._tree_search_widget)
+        debug_tree_layout.addWidget(self._tree_search_status_widget)
+        debug_tree_layout.addWidget(self._debug_tree)
+
+        debug_tree_wrapper_widget = QtWidgets.QWidget()
+        debug_tree_wrapper_widget.setLayout(debug_tree_layout)
+
+        visual_tree_splitter = QtWidgets.QSplitter()
+        visual_tree_splitter.setOrientation(QtCore.Qt.Vertical)
+        visual_tree_splitter.addWidget(debug_tree_wrapper_widget)
+        visual_tree_splitter.addWidget(self._rules_tree)
 
         # -- Settings Tab
         watch_css_folder_path_label = QtWidgets.QLabel('Segmented Css Folder Path:')
         self._watch_css_folder_path_widget = QtWidgets.QLineEdit()
         self._watch_css_folder_path_widget.textChanged.connect(self._validate)
+        self._watch_css_folder_path_widget.textChanged.connect(lambda: self.settings_changed.emit())
         self._validation_controls['folder_exists'].append(self._watch_css_folder_path_widget)
 
         watch_vars_folder_path_label = QtWidgets.QLabel('Segmented Vars Folder Path:')
         self._watch_vars_folder_path_widget = QtWidgets.QLineEdit()
         self._watch_vars_folder_path_widget.textChanged.connect(self._validate)
+        self._watch_vars_folder_path_widget.textChanged.connect(lambda: self.settings_changed.emit())
         self._validation_controls['folder_exists'].append(self._watch_vars_folder_path_widget)
 
+        # Variants are the folders next to the vars folder, they share the segments.
+        variant_label = QtWidgets.QLabel('Variant:')
+        self._variant_widget = QtWidgets.QComboBox()
+        self._variant_widget.activated.connect(self._variant_activated)
+
         compiled_file_path_label = QtWidgets.QLabel('Output Css File Path:')
         self._compiled_file_path_widget = QtWidgets.QLineEdit()
         self._compiled_file_path_widget.textChanged.connect(self._validate)
+        self._compiled_file_path_widget.textChanged.connect(lambda: self.settings_changed.emit())
         self._validation_controls['file_exists'].append(self._compiled_file_path_widget)
 
+        self._scoped_apply_widget = QtWidgets.QCheckBox('Scoped Style Updates')
+        self._scoped_apply_widget.setToolTip('Only restyle the widgets affected by the rules that changed.')
+
+        self._optimize_output_widget = QtWidgets.QCheckBox('Optimize Style Sheet')
+        self._optimize_output_widget.setToolTip('Strip comments and whitespace, merge rules and drop overridden '
+                                                'declarations before applying.')
+        self._optimize_output_widget.clicked.connect(lambda: self.optimize_output_changed.emit())
+
+        self._apply_to_application_widget = QtWidgets.QCheckBox('Apply To Application')
+        self._apply_to_application_widget.setToolTip('Set the style sheet once on the application instead of on '
+                                                     'every debugged window.')
+        self._apply_to_application_widget.clicked.connect(lambda: self.apply_to_application_changed.emit())
+
+        self._hover_pick_widget = QtWidgets.QCheckBox('Hover Pick')
+        self._hover_pick_widget.setToolTip('Highlight the widget under the cursor, press Insert to select it.')
+        self._hover_pick_widget.toggled.connect(lambda checked: self.hover_pick_changed.emit(checked))
+
+        self._highlight_layout_changes_widget = QtWidgets.QCheckBox('Highlight Layout Changes')
+        self._highlight_layout_changes_widget.setToolTip('Outline the widgets whose geometry or contents rect changed '
+                                                         'when a style sheet is applied. Every widget is read '
+                                                         'before and after each apply, slow on large windows.')
+        self._highlight_layout_changes_widget.toggled.connect(
+            lambda checked: self.highlight_layout_changes_changed.emit(checked))
+
         manual_update_widget = QtWidgets.QPushButton('Reload Css')
         manual_update_widget.pressed.connect(lambda: self.update_style_requested.emit())
 
@@ -83,8 +193,15 @@ class VisualTreeExplorer(QtWidgets.QDialog):
         settings_layout.addWidget(self._watch_css_folder_path_widget)
         settings_layout.addWidget(watch_vars_folder_path_label)
         settings_layout.addWidget(self._watch_vars_folder_path_widget)
+        settings_layout.addWidget(variant_label)
+        settings_layout.addWidget(self._variant_widget)
         settings_layout.addWidget(compiled_file_path_label)
         settings_layout.addWidget(self._compiled_file_path_widget)
+        settings_layout.addWidget(self._scoped_apply_widget)
+        settings_layout.addWidget(self._optimize_output_widget)
+        settings_layout.addWidget(self._apply_to_application_widget)
+        settings_layout.addWidget(self._hover_pick_widget)
+        settings_layout.addWidget(self._highlight_layout_changes_widget)
 
         settings_layout.addWidget(manual_update_widget)
         settings_layout.addStretch(1)
@@ -92,37 +209,309 @@ class VisualTreeExplorer(QtWidgets.QDialog):
         settings_wrapper_widget = QtWidgets.QWidget()
         settings_wrapper_widget.setLayout(settings_layout)
 
+        # -- Variables Tab
+        self._vars_filter_widget = QtWidgets.QLineEdit()
+        self._vars_filter_widget.setPlaceholderText('Filter variables...')
+        self._vars_filter_widget.textChanged.connect(self._filter_vars)
+
+        # Usages are only listed when a variable is expanded.
+        self._vars_tree = QtWidgets.QTreeWidget()
+        self._vars_tree.setUniformRowHeights(True)
+        self._vars_tree.setHeaderLabels(['Variable', 'Value', 'Uses'])
+        self._vars_tree.itemExpanded.connect(self._vars_item_expanded)
+
+        vars_layout = QtWidgets.QVBoxLayout()
+        vars_layout.addWidget(self._vars_filter_widget)
+        vars_layout.addWidget(self._vars_tree)
+
+        vars_wrapper_widget = QtWidgets.QWidget()
+        vars_wrapper_widget.setLayout(vars_layout)
+
+        # -- Profiler Tab
+        self._profiling_widget = QtWidgets.QCheckBox('Profile Style Reloads')
+
+        self._profile_tree = QtWidgets.QTreeWidget()
+        self._profile_tree.setUniformRowHeights(True)
+        self._profile_tree.setHeaderLabels(['Name', 'ms'])
+
+        export_profile_widget = QtWidgets.QPushButton('Export Json...')
+        export_profile_widget.pressed.connect(self._export_profile)
+
+        profiler_layout = QtWidgets.QVBoxLayout()
+        profiler_layout.addWidget(self._profiling_widget)
+        profiler_layout.addWidget(self._profile_tree)
+        profiler_layout.addWidget(export_profile_widget)
+
+        profiler_wrapper_widget = QtWidgets.QWidget()
+        profiler_wrapper_widget.setLayout(profiler_layout)
+
         # -- Tab widget
         tab_widget = QtWidgets.QTabWidget()
-        tab_widget.addTab(self._debug_tree, 'Visual Tree')
+        tab_widget.addTab(visual_tree_splitter, 'Visual Tree')
         tab_widget.addTab(settings_wrapper_widget, 'Settings')
+        tab_widget.addTab(vars_wrapper_widget, 'Variables')
+        tab_widget.addTab(profiler_wrapper_widget, 'Profiler')
 
         # -- Log
-        self._log_widget = QtWidgets.QTextEdit()
+        self._log_level_widget = QtWidgets.QComboBox()
+        for level in [LEVEL_DEBUG, LEVEL_INFO, LEVEL_WARNING, LEVEL_ERROR]:
+            self._log_level_widget.addItem(LEVEL_NAMES[level], level)
+        self._log_level_widget.setCurrentIndex(1)
+        self._log_level_widget.currentIndexChanged.connect(self._log_level_changed)
+
+        # Append only view, the block count is bounded like the log buffer.
+        self._log_widget = QtWidgets.QPlainTextEdit()
+        self._log_widget.setReadOnly(True)
+        self._log_widget.setUndoRedoEnabled(False)
+        self._log_widget.setMaximumBlockCount(self._log.capacity)
+
+        log_layout = QtWidgets.QVBoxLayout()
+        log_layout.setContentsMargins(0, 0, 0, 0)
+        log_layout.addWidget(self._log_level_widget)
+        log_layout.addWidget(self._log_widget)
+
+        log_wrapper_widget = QtWidgets.QWidget()
+        log_wrapper_widget.setLayout(log_layout)
 
         # -- Splitter
         splitter = QtWidgets.QSplitter()
         splitter.setOrientation(QtCore.Qt.Vertical)
         splitter.addWidget(tab_widget)
-        splitter.addWidget(self._log_widget)
+        splitter.addWidget(log_wrapper_widget)
 
         root_layout = QtWidgets.QVBoxLayout()
         root_layout.addWidget(splitter)
         self.setLayout(root_layout)
 
-    def _validate(self):
+    def _set_debug_tree_model(self, model):
+        if self._debug_tree.model() is model:
+            return
+
+        current_item = self._debug_tree.currentIndex().data(VisualTreeModel.VISUAL_ITEM_ROLE)
+
+        # Detached from the tree model while unused so it doesn't track its changes.
+        if model is self._tree_filter_model:
+            self._tree_filter_model.setSourceModel(self._tree_model)
+
+        self._debug_tree.setModel(model)
+        self._debug_tree.selectionModel().selectionChanged.connect(self._selection_changed)
+
+        if model is self._tree_model:
+            self._tree_filter_model.setSourceModel(None)
+
+        self._restore_current_item(current_item)
+
+    def _restore_current_item(self, visual_item):
+        tree_index = self._debug_tree_index(visual_item) if visual_item is not None else QtCore.QModelIndex()
+
+        if tree_index.isValid():
+            self._debug_tree.selectionModel().setCurrentIndex(
+                tree_index, QtCore.QItemSelectionModel.ClearAndSelect | QtCore.QItemSelectionModel.Rows)
+            self._debug_tree.scrollTo(tree_index)
+
+    def _debug_tree_index(self, visual_item):
+        tree_index = self._tree_model.index_for(visual_item)
+
+        if self._debug_tree.model() is self._tree_filter_model:
+            return self._tree_filter_model.mapFromSource(tree_index)
+
+        return tree_index
+
+    def _root_index(self, visual_root):
+        for root_index, root in enumerate(self._roots):
+            if root is visual_root:
+                return root_index
+
+        return -1
+
+    def _update_rules(self):
+        self._rules_tree.clear()
+        visual_item = self._debug_tree.currentIndex().data(VisualTreeModel.VISUAL_ITEM_ROLE)
+
+        if self._rule_index is None or visual_item is None:
+            return
+
+        # Last rules win, show them first.
+        for selector in reversed(self._rule_index.match(visual_item)):
+            rule_item = QtWidgets.QTreeWidgetItem(self._rules_tree, [selector.text,
+                                                                     selector.rule.source,
+                                                                     str(selector.specificity)])
+
+            for name, value in selector.rule.declarations:
+                QtWidgets.QTreeWidgetItem(rule_item, ['{}: {}'.format(name, value)])
+
+        self._rules_tree.resizeColumnToContents(0)
+
+    def _update_vars(self):
+        self._vars_tree.clear()
+
+        if self._vars_index is None:
+            return
+
+        self._vars_tree.setUpdatesEnabled(False)
+
+        for name in self._vars_index.names:
+            vars_item = QtWidgets.QTreeWidgetItem(self._vars_tree, [name,
+                                                                  self._vars_index.value(name),
+                                                                  str(len(self._vars_index.locations(name, True)))])
+            vars_item.setChildIndicatorPolicy(QtWidgets.QTreeWidgetItem.ShowIndicator)
+
+        self._vars_tree.setUpdatesEnabled(True)
+        self._vars_tree.resizeColumnToContents(0)
+        self._filter_vars()
+
+    def _update_profile(self):
+        self._profile_tree.clear()
+
+        if self._profile_report is None:
+            return
+
+        sections = [('Stages', self._profile_report.stages),
+                    ('Slowest Widgets', self._profile_report.widgets),
+                    ('Slowest Subtrees', self._profile_report.subtrees),
+                    ('Slowest Segments', self._profile_report.segments)]
+
+        for section_name, entries in sections:
+            section_item = QtWidgets.QTreeWidgetItem(self._profile_tree, [section_name])
+            section_item.setExpanded(True)
+
+            for name, ms in entries:
+                QtWidgets.QTreeWidgetItem(section_item, [name, '{:.2f}'.format(ms)])
+
+        self._profile_tree.resizeColumnToContents(0)
+
+    def _append_log_entries(self, entries):
+        log_level = self._log_level_widget.itemData(self._log_level_widget.currentIndex())
+        lines = [entry.to_text() for entry in entries if entry.level >= log_level]
+
+        if lines:
+            self._log_widget.appendPlainText('\n'.join(lines))
+
+    def _validate(self, *args):
+        # Returns True when the validity of any path changed.
         valid_style = 'border: 1px solid black;'
         invalid_style = 'border: 2px solid red;'
+        watch_paths = set()
+        changed = False
 
         for validation_type, control_list in iteritems(self._validation_controls):
             for control in control_list:
-                control.setStyleSheet(valid_style)
-                control.setProperty('valid', True)
+                self._validation_counters['validations'] += 1
+                path = control.text()
+
+                if validation_type == 'file_exists':
+                    valid = os.path.isfile(path)
+                else:
+                    valid = os.path.isdir(path)
+
+                # Restyling is expensive, only do it when the state flips.
+                if self._validation_results.get(control) != valid:
+                    self._validation_results[control] = valid
+                    self._validation_counters['validation_restyles'] += 1
+                    changed = True
+                    control.setStyleSheet(valid_style if valid else invalid_style)
+                    control.setProperty('valid', valid)
+
+                if path:
+                    watch_paths.add(self._closest_folder(path))
+
+        self._update_path_watcher(watch_paths)
+        self._update_variants()
+        return changed
 
-                if (validation_type == 'file_exists' and not os.path.isfile(control.text())) or \
-                   (validation_type == 'folder_exists' and not os.path.isdir(control.text())):
-                    control.setStyleSheet(invalid_style)
-                    control.setProperty('valid', False)
+    def _update_variants(self):
+        vars_folder_path = os.path.normpath(self.watch_vars_folder_path)
+        css_folder_path = os.path.normpath(self.watch_css_folder_path)
+        vars_folder_valid = bool(self._validation_results.get(self._watch_vars_folder_path_widget))
+        variants_key = (vars_folder_path, css_folder_path, vars_folder_valid)
+
+        if variants_key == self._variants_key:
+            return
+
+        self._variants_key = variants_key
+        variant_names = self._list_variants(vars_folder_path, css_folder_path) if vars_folder_valid else []
+
+        current_names = [self._variant_widget.itemText(index) for index in range(self._variant_widget.count())]
+
+        if variant_names != current_names:
+            self._variant_widget.clear()
+            self._variant_widget.addItems(variant_names)
+
+        self._variant_widget.setEnabled(len(variant_names) > 1)
+
+        if os.path.basename(vars_folder_path) in variant_names:
+            self._variant_widget.setCurrentIndex(variant_names.index(os.path.basename(vars_folder_path)))
+
+    def _update_path_watcher(self, watch_paths):
+        watch_paths.discard(None)
+        watched_paths = set(self._path_watcher.directories())
+
+        if watched_paths - watch_paths:
+            self._path_watcher.removePaths(list(watched_paths - watch_paths))
+
+        if watch_paths - watched_paths:
+            self._path_watcher.addPaths(list(watch_paths - watched_paths))
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _closest_folder(path):
+        # Closest existing folder containing the path, creating, deleting or renaming
+        # the path shows up as a change of that folder.
+        folder_path = os.path.dirname(os.path.abspath(path))
+
+        while not os.path.isdir(folder_path):
+            parent_folder_path = os.path.dirname(folder_path)
+
+            if parent_folder_path == folder_path:
+                return None
+            folder_path = parent_folder_path
+
+        return folder_path
+
+    @staticmethod
+    def _list_variants(vars_folder_path, css_folder_path):
+        # Sibling folders of the vars folder only holding the kind of files it has,
+        # the output, version control or cache folders next to it aren't variants.
+        # Relative paths are resolved first, a relative vars folder has no dirname.
+        vars_folder_path = os.path.abspath(vars_folder_path)
+        css_folder_path = os.path.abspath(css_folder_path)
+        variants_folder_path = os.path.dirname(vars_folder_path)
+
+        try:
+            vars_extensions = set([os.path.splitext(file_name)[1] for file_name in os.listdir(vars_folder_path)
+                                   if os.path.isfile(os.path.join(vars_folder_path, file_name))])
+            folder_names = os.listdir(variants_folder_path)
+        except OSError:
+            return []
+
+        variant_names = []
+
+        for folder_name in folder_names:
+            folder_path = os.path.join(variants_folder_path, folder_name)
+
+            if folder_path == vars_folder_path:
+                variant_names.append(folder_name)
+                continue
+
+            if folder_name.startswith('.') or folder_path == css_folder_path or not os.path.isdir(folder_path):
+                continue
+
+            try:
+                file_names = [file_name for file_name in os.listdir(folder_path)
+                              if os.path.isfile(os.path.join(folder_path, file_name))]
+            except OSError:
+                continue
+
+            if file_names and all([os.path.splitext(file_name)[1] in vars_extensions for file_name in file_names]):
+                variant_names.append(folder_name)
+
+        return sorted(variant_names)
+
+    @staticmethod
+    def _root_label(visual_root):
+        return visual_root.windowTitle() or visual_root.objectName() or type(visual_root).__name__
 
     # ====================================================================
     # +++ GET/SET
@@ -152,44 +541,146 @@ class VisualTreeExplorer(QtWidgets.QDialog):
         self._compiled_file_path_widget.setText(value)
 
     @property
-    def is_settings_valid(self):
-        self._validate()
-        invalid_controls = [control
-                            for controls in self._validation_controls.values()
-                            for control in controls
-                            if control.property('valid') is False]
+    def rule_index(self):
+        return self._rule_index
+
+    @rule_index.setter
+    def rule_index(self, value):
+        self._rule_index = value
+        self._update_rules()
+
+    @property
+    def profiling(self):
+        return self._profiling_widget.isChecked()
+
+    @profiling.setter
+    def profiling(self, value):
+        self._profiling_widget.setChecked(value)
+
+    @property
+    def profile_report(self):
+        return self._profile_report
+
+    @profile_report.setter
+    def profile_report(self, value):
+        self._profile_report = value
+        self._update_profile()
+
+    @property
+    def vars_index(self):
+        return self._vars_index
+
+    @vars_index.setter
+    def vars_index(self, value):
+        self._vars_index = value
+        self._update_vars()
+
+    @property
+    def optimize_output(self):
+        return self._optimize_output_widget.isChecked()
+
+    @optimize_output.setter
+    def optimize_output(self, value):
+        self._optimize_output_widget.setChecked(value)
+
+    @property
+    def apply_to_application(self):
+        return self._apply_to_application_widget.isChecked()
+
+    @apply_to_application.setter
+    def apply_to_application(self, value):
+        self._apply_to_application_widget.setChecked(value)
+
+    @property
+    def current_root(self):
+        root_index = self._root_widget.currentIndex()
+        return self._roots[root_index] if root_index != -1 else None
+
+    @current_root.setter
+    def current_root(self, value):
+        self._root_widget.setCurrentIndex(self._root_index(value))
+
+        if value is not None:
+            self.update_tree(value)
+
+    @property
+    def hover_pick(self):
+        return self._hover_pick_widget.isChecked()
+
+    @hover_pick.setter
+    def hover_pick(self, value):
+        self._hover_pick_widget.setChecked(value)
+
+    @property
+    def highlight_layout_changes(self):
+        return self._highlight_layout_changes_widget.isChecked()
+
+    @highlight_layout_changes.setter
+    def highlight_layout_changes(self, value):
+        self._highlight_layout_changes_widget.setChecked(value)
+
+    @property
+    def scoped_apply(self):
+        return self._scoped_apply_widget.isChecked()
+
+    @scoped_apply.setter
+    def scoped_apply(self, value):
+        self._scoped_apply_widget.setChecked(value)
+
+    @property
+    def log(self):
+        return self._log
 
-        return not len(invalid_controls)
+    @property
+    def validation_counters(self):
+        return dict(self._validation_counters)
+
+    @property
+    def is_settings_valid(self):
+        return all(self._validation_results.values())
 
     # ====================================================================
     # +++ PUBLIC METHODS
     # =====================================================================
-    def log_message(self, message):
-        current_text = self._log_widget.toPlainText()
-        current_text += '\n{}'.format(message)
-        self._log_widget.setText(current_text)
-        print('text set')
+    def log_message(self, message, level=LEVEL_INFO, **fields):
+        return self._log.log(message, level, **fields)
 
-    def update_tree(self, visual_root, tree_root=None):
+    def update_tree(self, visual_root):
+        self._tree_model.set_root(visual_root)
+        self._search_index.set_root(visual_root)
+        self._search_tree()
 
-        if not tree_root:
-            self._debug_tree.clear()
-            tree_root = QtWidgets.QTreeWidgetItem(self._debug_tree, ['*', '*'])
+    def add_root(self, visual_root):
+        self._roots.append(visual_root)
+        self._root_widget.addItem(self._root_label(visual_root))
 
-        for visual_child in visual_root.children():
-            visual_child_hash = hashlib.md5(str(visual_child).encode('utf-8')).hexdigest()
-            tree_child = QtWidgets.QTreeWidgetItem(tree_root, [str(type(visual_child)), visual_child_hash])
-            tree_child.setData(2, 99, visual_child)
+    def remove_root(self, visual_root):
+        # Only compared by identity, the root may be half destroyed.
+        root_index = self._root_index(visual_root)
 
-            if visual_child.children():
-                self.update_tree(visual_child, tree_child)
+        if root_index != -1:
+            del self._roots[root_index]
+            self._root_widget.removeItem(root_index)
 
-    def set_selected_item(self, visual_item):
-        visual_child_hash = hashlib.md5(str(visual_item).encode('utf-8')).hexdigest()
-        tree_item = self._debug_tree.findItems(visual_child_hash, QtCore.Qt.MatchRecursive, 1)
+    def update_root_label(self, visual_root):
+        root_index = self._root_index(visual_root)
 
-        if tree_item:
-            self._debug_tree.setCurrentItem(tree_item[0], 0, QtCore.QItemSelectionModel.ClearAndSelect)
+        if root_index != -1:
+            self._root_widget.setItemText(root_index, self._root_label(visual_root))
+
+    def set_selected_item(self, visual_item):
+        tree_index = self._debug_tree_index(visual_item)
+
+        if not tree_index.isValid() and self._debug_tree.model() is self._tree_filter_model:
+            # Hidden by the search, picked items are always shown.
+            self._tree_search_widget.clear()
+            self._search_tree()
+            tree_index = self._debug_tree_index(visual_item)
+
+        if tree_index.isValid():
+            self._debug_tree.selectionModel().setCurrentIndex(
+                tree_index, QtCore.QItemSelectionModel.ClearAndSelect | QtCore.QItemSelectionModel.Rows)
+            self._debug_tree.scrollTo(tree_index)
             self._debug_tree.resizeColumnToContents(0)
             self._debug_tree.resizeColumnToContents(1)
 
@@ -199,11 +690,134 @@ class VisualTreeExplorer(QtWidgets.QDialog):
     def closeEvent(self, event):
         self.closing.emit()
 
+    def showEvent(self, event):
+        super(VisualTreeExplorer, self).showEvent(event)
+
+        if self._tree_search_widget.text().strip():
+            self._tree_search_timer.start()
+
+    def hideEvent(self, event):
+        super(VisualTreeExplorer, self).hideEvent(event)
+        self._tree_search_timer.stop()
+        self._search_index.stop()
+
     # ====================================================================
     # +++ CALLBACKS
     # =====================================================================
-    def _selection_changed(self):
-        visual_items = [o.data(2, 99) for o in self._debug_tree.selectedItems()
-                        if o.data(2, 99)]
+    def _export_profile(self):
+        if self._profile_report is None:
+            self.log_message('No profile to export, enable profiling and reload.')
+            return
+
+        file_path = QtWidgets.QFileDialog.getSaveFileName(self, 'Export Profile', '', 'Json (*.json)')[0]
+
+        if file_path:
+            self._profile_report.save(file_path)
+            self.log_message('Profile exported to {}'.format(file_path))
+
+    def _root_activated(self, index):
+        if 0 <= index < len(self._roots):
+            self.update_tree(self._roots[index])
+            self.root_selected.emit(self._roots[index])
+
+    def _search_tree(self):
+        self._tree_search_timer.stop()
+        search_text = self._tree_search_widget.text()
+
+        if not search_text.strip():
+            # Nothing stays watched while the tree isn't searched, the next search
+            # indexes it again.
+            self._search_index.stop()
+            self._set_debug_tree_model(self._tree_model)
+            self._tree_search_status_widget.hide()
+            return
+
+        matches = self._search_index.search(search_text)
+        shown_matches = self._search_index.first(matches, self.SEARCH_RESULTS)
+        ancestors = self._search_index.ancestors(shown_matches)
+
+        # The model only creates the nodes it needs, fetch the paths to the matches.
+        for visual_item in shown_matches:
+            self._tree_model.index_for(visual_item)
+
+        # Setting the items resets the filter model, and with it the selection.
+        current_item = self._debug_tree.currentIndex().data(VisualTreeModel.VISUAL_ITEM_ROLE)
+        self._tree_filter_model.visible_items = ancestors.union(shown_matches)
+        self._set_debug_tree_model(self._tree_filter_model)
+
+        for visual_item in ancestors:
+            self._debug_tree.expand(self._debug_tree_index(visual_item))
+
+        self._restore_current_item(current_item)
+
+        if len(matches) > len(shown_matches):
+            status = '{} matches, showing the first {}.'.format(len(matches), len(shown_matches))
+        else:
+            status = '{} matches.'.format(len(matches))
+
+        if self._search_index.is_indexing:
+            status += ' Indexing {} objects...'.format(self._search_index.size)
+
+        self._tree_search_status_widget.setText(status)
+        self._tree_search_status_widget.show()
+
+    def _search_index_changed(self):
+        # Keep the results in sync with the live tree.
+        if self._debug_tree.model() is self._tree_filter_model and self.isVisible():
+            self._tree_search_timer.start()
+
+    def _filter_vars(self, *args):
+        filter_text = self._vars_filter_widget.text().lower()
+
+        for index in range(self._vars_tree.topLevelItemCount()):
+            vars_item = self._vars_tree.topLevelItem(index)
+            vars_item.setHidden(filter_text not in vars_item.text(0).lower())
+
+    def _vars_item_expanded(self, vars_item):
+        if vars_item.parent() is not None or vars_item.childCount() or self._vars_index is None:
+            return
+
+        name = vars_item.text(0)
+
+        for segment, line in self._vars_index.locations(name):
+            QtWidgets.QTreeWidgetItem(vars_item, ['{}:{}'.format(segment, line)])
+
+        for dependency in self._vars_index.dependencies(name):
+            QtWidgets.QTreeWidgetItem(vars_item, ['defined with {}'.format(dependency)])
+
+        for dependent in self._vars_index.dependents(name):
+            QtWidgets.QTreeWidgetItem(vars_item, ['used by {}'.format(dependent),
+                                                  self._vars_index.value(dependent),
+                                                  str(len(self._vars_index.locations(dependent)))])
+
+        if not vars_item.childCount():
+            vars_item.setChildIndicatorPolicy(QtWidgets.QTreeWidgetItem.DontShowIndicatorWhenChildless)
+
+    def _variant_activated(self, index):
+        vars_folder_path = os.path.join(os.path.dirname(os.path.normpath(self.watch_vars_folder_path)),
+                                        self._variant_widget.itemText(index))
+
+        if os.path.normpath(vars_folder_path) != os.path.normpath(self.watch_vars_folder_path):
+            self.watch_vars_folder_path = vars_folder_path
+            self.variant_selected.emit(vars_folder_path)
+
+    def _paths_changed(self, *args):
+        # Variants may have been added or removed.
+        self._variants_key = None
+
+        if self._validate():
+            self.settings_changed.emit()
+
+    def _log_entries_added(self, entries):
+        self._append_log_entries(entries)
+
+    def _log_level_changed(self, *args):
+        self._log_widget.clear()
+        self._append_log_entries(self._log.entries)
+
+    def _selection_changed(self, *args):
+        visual_items = [index.data(VisualTreeModel.VISUAL_ITEM_ROLE)
+                        for index in self._debug_tree.selectionModel().selectedRows(0)]
 
         self.selection_changed.emit(visual_items)
+        self._update_rules()
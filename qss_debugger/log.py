@@ -0,0 +1,156 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import time
+import collections
+
+from Qt import QtCore
+
+
+# *********************************************************************
+# +++ CONSTANTS
+# *********************************************************************
+LEVEL_DEBUG = 10
+LEVEL_INFO = 20
+LEVEL_WARNING = 30
+LEVEL_ERROR = 40
+
+LEVEL_NAMES = {LEVEL_DEBUG: 'DEBUG',
+               LEVEL_INFO: 'INFO',
+               LEVEL_WARNING: 'WARNING',
+               LEVEL_ERROR: 'ERROR'}
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualLogEntry(object):
+    # fields holds structured values such as compile_ms or apply_ms.
+    __slots__ = ('timestamp', 'level', 'message', 'fields')
+
+    def __init__(self, message, level=LEVEL_INFO, fields=None, timestamp=None):
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.level = level
+        self.message = message
+        self.fields = fields if fields is not None else {}
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def to_text(self):
+        text = '{} {:<7} {}'.format(time.strftime('%H:%M:%S', time.localtime(self.timestamp)),
+                                    LEVEL_NAMES.get(self.level, str(self.level)),
+                                    self.message)
+
+        if self.fields:
+            text += ' [{}]'.format(' '.join(['{}={}'.format(name, self._format_value(value))
+                                             for name, value in sorted(self.fields.items())]))
+
+        return text
+
+    def to_dict(self):
+        return {'timestamp': self.timestamp,
+                'level': LEVEL_NAMES.get(self.level, self.level),
+                'message': self.message,
+                'fields': dict(self.fields)}
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _format_value(value):
+        if isinstance(value, float):
+            return '{:.2f}'.format(value)
+
+        return str(value)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualLog(QtCore.QObject):
+    # Entries are kept in a ring buffer so long sessions use constant memory, new
+    # entries are collected and emitted once per event loop iteration.
+
+    # =====================================================================
+    # +++ SIGNALS
+    # =====================================================================
+    entries_added = QtCore.Signal(list)
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None, capacity=5000):
+        super(VisualLog, self).__init__(parent)
+        self._entries = collections.deque(maxlen=capacity)
+        self._pending_entries = []
+
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self.flush)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def capacity(self):
+        return self._entries.maxlen
+
+    @property
+    def entries(self):
+        return list(self._entries)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def log(self, message, level=LEVEL_INFO, **fields):
+        entry = VisualLogEntry(message, level, fields)
+        self._entries.append(entry)
+        self._pending_entries.append(entry)
+
+        if not self._flush_timer.isActive():
+            self._flush_timer.start()
+
+        return entry
+
+    def debug(self, message, **fields):
+        return self.log(message, LEVEL_DEBUG, **fields)
+
+    def info(self, message, **fields):
+        return self.log(message, LEVEL_INFO, **fields)
+
+    def warning(self, message, **fields):
+        return self.log(message, LEVEL_WARNING, **fields)
+
+    def error(self, message, **fields):
+        return self.log(message, LEVEL_ERROR, **fields)
+
+    def flush(self):
+        self._flush_timer.stop()
+
+        if not self._pending_entries:
+            return
+
+        # Only the entries still in the buffer are delivered.
+        pending_entries = self._pending_entries[-self.capacity:]
+        self._pending_entries = []
+        self.entries_added.emit(pending_entries)
+
+    def clear(self):
+        self._entries.clear()
+        self._pending_entries = []
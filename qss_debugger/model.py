@@ -0,0 +1,366 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import functools
+
+from Qt import QtCore
+
+from qss_debugger.events import VisualTreeEventFilter
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualTreeNode(object):
+    # children stays None until the node is expanded.
+    __slots__ = ('obj', 'parent', 'row', 'children')
+
+    def __init__(self, obj, parent=None, row=0):
+        self.obj = obj
+        self.parent = parent
+        self.row = row
+        self.children = None
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def visual_children(self):
+        try:
+            return self.obj.children()
+        except RuntimeError:
+            # The object was deleted.
+            return []
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualTreeModel(QtCore.QAbstractItemModel):
+    VISUAL_ITEM_ROLE = QtCore.Qt.UserRole
+    HEADER_LABELS = ['Type', 'Object Name']
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None):
+        super(VisualTreeModel, self).__init__(parent)
+        self._invisible_root = VisualTreeNode(None)
+        self._invisible_root.children = []
+        self._root = None
+        self._root_destroyed_slot = None
+
+        # Identity index of every node created so far, used to find the node of a
+        # widget without walking the tree.
+        self._nodes = {}
+
+        # Structural changes of the fetched nodes are collected and patched once per
+        # event loop iteration.
+        self._event_filter = VisualTreeEventFilter(self, {QtCore.QEvent.ChildAdded: self._children_changed,
+                                                          QtCore.QEvent.ChildRemoved: self._children_changed})
+        self._dirty_nodes = set()
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self._flush)
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+
+        return self._invisible_root
+
+    def _fetch(self, node):
+        if node.children is not None:
+            return
+
+        visual_children = node.visual_children()
+
+        # Only fetched nodes are tracked, the others read their children when expanded.
+        try:
+            node.obj.installEventFilter(self._event_filter)
+        except RuntimeError:
+            pass
+
+        if not visual_children:
+            node.children = []
+            return
+
+        self.beginInsertRows(self.node_index(node), 0, len(visual_children) - 1)
+        node.children = [VisualTreeNode(visual_child, node, row)
+                         for row, visual_child in enumerate(visual_children)]
+
+        for child in node.children:
+            self._nodes[child.obj] = child
+
+        self.endInsertRows()
+
+    def _release(self, node):
+        # Drops the node and its descendants from the index and stops tracking them.
+        if self._nodes.get(node.obj) is node:
+            del self._nodes[node.obj]
+
+        self._dirty_nodes.discard(node)
+
+        if node.children is None:
+            return
+
+        try:
+            node.obj.removeEventFilter(self._event_filter)
+        except RuntimeError:
+            pass
+
+        for child in node.children:
+            self._release(child)
+
+    def _update_children(self, node):
+        visual_children = node.visual_children()
+        visual_children_set = set(visual_children)
+        parent_index = self.node_index(node)
+
+        for row in reversed(range(len(node.children))):
+            child = node.children[row]
+
+            if child.obj not in visual_children_set:
+                self.beginRemoveRows(parent_index, row, row)
+                del node.children[row]
+                self._release(child)
+                self.endRemoveRows()
+
+        for row, child in enumerate(node.children):
+            child.row = row
+
+        current_children_set = set([child.obj for child in node.children])
+        new_children = [visual_child for visual_child in visual_children
+                        if visual_child not in current_children_set]
+
+        if new_children:
+            first_row = len(node.children)
+            self.beginInsertRows(parent_index, first_row, first_row + len(new_children) - 1)
+
+            for row, visual_child in enumerate(new_children, first_row):
+                child = VisualTreeNode(visual_child, node, row)
+                node.children.append(child)
+                self._nodes[visual_child] = child
+
+            self.endInsertRows()
+
+    def _clear(self):
+        for node in self._invisible_root.children:
+            self._release(node)
+
+        self._invisible_root.children = []
+        self._nodes = {}
+        self._dirty_nodes = set()
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def set_root(self, visual_root):
+        # Only the current root empties the model when destroyed.
+        if self._root_destroyed_slot is not None:
+            try:
+                self._root.destroyed.disconnect(self._root_destroyed_slot)
+            except (RuntimeError, TypeError):
+                pass
+
+        self._root = visual_root
+        self._root_destroyed_slot = functools.partial(self._root_destroyed, visual_root)
+        self.beginResetModel()
+        self._clear()
+
+        root_node = VisualTreeNode(visual_root, self._invisible_root, 0)
+        self._invisible_root.children = [root_node]
+        self._nodes = {visual_root: root_node}
+        visual_root.destroyed.connect(self._root_destroyed_slot)
+        self.endResetModel()
+
+    def node(self, visual_item):
+        return self._nodes.get(visual_item)
+
+    def visual_item(self, row, parent=QtCore.QModelIndex()):
+        # Same as index(row, 0, parent).data(VISUAL_ITEM_ROLE) without the index.
+        return self._node(parent).children[row].obj
+
+    def node_index(self, node, column=0):
+        if node is self._invisible_root:
+            return QtCore.QModelIndex()
+
+        return self.createIndex(node.row, column, node)
+
+    def index_for(self, visual_item):
+        node = self._nodes.get(visual_item)
+
+        if node is None:
+            # Not fetched yet, fetch down from the closest ancestor that has a node.
+            path = []
+            while visual_item is not None and visual_item not in self._nodes:
+                path.append(visual_item)
+                visual_item = visual_item.parent()
+
+            if visual_item is None:
+                return QtCore.QModelIndex()
+
+            node = self._nodes[visual_item]
+
+            for visual_ancestor in reversed(path):
+                self._fetch(node)
+                node = self._nodes.get(visual_ancestor)
+
+                if node is None:
+                    return QtCore.QModelIndex()
+
+        return self.node_index(node)
+
+    # ====================================================================
+    # +++ OVERRIDES
+    # =====================================================================
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        node = self._node(parent)
+
+        if node.children is None or not 0 <= row < len(node.children):
+            return QtCore.QModelIndex()
+
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+
+        return self.node_index(index.internalPointer().parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+
+        children = self._node(parent).children
+        return len(children) if children is not None else 0
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self.HEADER_LABELS)
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        node = self._node(parent)
+
+        if node.children is None:
+            return bool(node.visual_children())
+
+        return bool(node.children)
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        return node.children is None and bool(node.visual_children())
+
+    def fetchMore(self, parent):
+        self._fetch(self._node(parent))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        node = index.internalPointer()
+
+        if role == self.VISUAL_ITEM_ROLE:
+            return node.obj
+
+        if role == QtCore.Qt.DisplayRole:
+            if index.column() == 0:
+                return str(type(node.obj))
+
+            try:
+                return node.obj.objectName()
+            except RuntimeError:
+                return None
+
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADER_LABELS[section]
+
+        return None
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _children_changed(self, obj, event):
+        node = self._nodes.get(obj)
+
+        if node is not None and node.children is not None:
+            self._dirty_nodes.add(node)
+            self._flush_timer.start()
+
+    def _flush(self):
+        dirty_nodes = self._dirty_nodes
+        self._dirty_nodes = set()
+
+        for node in dirty_nodes:
+            # Skip nodes released while patching an ancestor.
+            if self._nodes.get(node.obj) is node and node.children is not None:
+                self._update_children(node)
+
+    def _root_destroyed(self, visual_root, *args):
+        # Only compared by identity, the root is half destroyed.
+        if visual_root is not self._root:
+            return
+
+        self._root = None
+        self._root_destroyed_slot = None
+        self.beginResetModel()
+        self._clear()
+        self.endResetModel()
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualTreeFilterModel(QtCore.QSortFilterProxyModel):
+    # Shows only the given objects, the caller includes the ancestors. The set is
+    # computed from the search index so rows are accepted with a lookup.
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None):
+        super(VisualTreeFilterModel, self).__init__(parent)
+        self._visible_items = None
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def visible_items(self):
+        return self._visible_items
+
+    @visible_items.setter
+    def visible_items(self, value):
+        # None shows everything. A reset drops the mappings at once, invalidating the
+        # filter checks them row by row.
+        self.beginResetModel()
+        self._visible_items = value
+        self.endResetModel()
+
+    # ====================================================================
+    # +++ OVERRIDES
+    # =====================================================================
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._visible_items is None:
+            return True
+
+        return self.sourceModel().visual_item(source_row, source_parent) in self._visible_items
@@ -0,0 +1,254 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import re
+
+from qss_debugger.parser import VisualQssParser
+
+
+# *********************************************************************
+# +++ CONSTANTS
+# *********************************************************************
+_QUOTED_PATTERN = re.compile(r'("[^"]*"|\'[^\']*\')')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_PROPERTY_NAME_PATTERN = re.compile(r'^-?[A-Za-z_][\w-]*$')
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualOptimizeReport(object):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self):
+        self.input_size = 0
+        self.output_size = 0
+        self.input_rules = 0
+        self.output_rules = 0
+        self.merged_rules = 0
+        self.dropped_declarations = 0
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def size_reduction(self):
+        return 1.0 - float(self.output_size) / self.input_size if self.input_size else 0.0
+
+    @property
+    def rule_reduction(self):
+        return 1.0 - float(self.output_rules) / self.input_rules if self.input_rules else 0.0
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def to_dict(self):
+        return {'input_size': self.input_size,
+                'output_size': self.output_size,
+                'input_rules': self.input_rules,
+                'output_rules': self.output_rules,
+                'merged_rules': self.merged_rules,
+                'dropped_declarations': self.dropped_declarations}
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssOptimizer(object):
+    # Rewrites a compiled style sheet into an equivalent smaller one: comments and
+    # whitespace are removed, rules with the same selector are merged into the last
+    # of them and declarations overridden by a later one for the same selector are
+    # dropped. A declaration is only moved past other rules when none of them sets
+    # the same property, so the cascade is never changed. Rules the parser can't
+    # fully understand are kept as they are and never merged.
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _minify_value(value):
+        # Whitespace inside quoted strings is kept.
+        parts = _QUOTED_PATTERN.split(value)
+        parts[::2] = [_WHITESPACE_PATTERN.sub(' ', part) for part in parts[::2]]
+        return ''.join(parts).strip()
+
+    @staticmethod
+    def _split_declarations(body):
+        # Declaration texts of a rule body, semicolons inside quotes or parentheses
+        # (url(data:...;base64,...), "a;b") don't end a declaration. None when the
+        # quotes or parentheses aren't balanced.
+        declarations = []
+        start = 0
+        quote = None
+        escaped = False
+        depth = 0
+
+        for index, character in enumerate(body):
+            if escaped:
+                escaped = False
+            elif character == '\\':
+                escaped = True
+            elif quote:
+                if character == quote:
+                    quote = None
+            elif character in '"\'':
+                quote = character
+            elif character == '(':
+                depth += 1
+            elif character == ')':
+                depth -= 1
+
+                if depth < 0:
+                    return None
+            elif character == ';' and not depth:
+                declarations.append(body[start:index])
+                start = index + 1
+
+        if quote or depth:
+            return None
+
+        declarations.append(body[start:])
+        return [declaration.strip() for declaration in declarations if declaration.strip()]
+
+    @staticmethod
+    def _parse_declarations(body):
+        # [(name, value)] with the names as written, None when a declaration can't
+        # be understood.
+        declarations = VisualQssOptimizer._split_declarations(body)
+
+        if declarations is None:
+            return None
+
+        parsed_declarations = []
+        for declaration in declarations:
+            name, separator, value = declaration.partition(':')
+            name = name.strip()
+
+            if not separator or not _PROPERTY_NAME_PATTERN.match(name):
+                return None
+
+            parsed_declarations.append((name, VisualQssOptimizer._minify_value(value)))
+
+        return parsed_declarations
+
+    @staticmethod
+    def _property_key(name):
+        # Style properties are case insensitive, the names of Qt properties aren't.
+        return name if name.lower().startswith('qproperty-') else name.lower()
+
+    @staticmethod
+    def _family(name):
+        # Shorthands and their longhands (border, border-color...) share a family,
+        # moving one past the other would change which one wins.
+        return name.lower().split('-')[0]
+
+    @staticmethod
+    def _rule_text(selector_text, declarations):
+        return '{}{{{}}}'.format(selector_text, ';'.join(['{}:{}'.format(name, value)
+                                                         for name, value in declarations]))
+
+    @staticmethod
+    def optimize(content, report=None):
+        report = report if report is not None else VisualOptimizeReport()
+        rules = VisualQssParser.parse(content)
+
+        report.input_size = len(content)
+        report.input_rules = len(rules)
+
+        # [selector text, [(name, value)], body] in cascade order, None once merged
+        # away. body is only set for the rules that are kept as they are.
+        entries = []
+        last_entry = {}
+
+        # {property family: [entry indices]} in order, entries that later lose the
+        # property are not removed, which only makes the check more conservative.
+        family_entries = {}
+
+        # Index of the last rule kept as it is. Its declarations aren't known, it
+        # could set any property, nothing is moved past it.
+        barrier_index = -1
+
+        for rule in rules:
+            # The parser's declarations are lower case and split on every semicolon,
+            # the body is read again.
+            declarations = VisualQssOptimizer._parse_declarations(rule.body)
+            mergeable = rule.valid and declarations is not None and not any('!important' in value.lower()
+                                                                            for _, value in declarations)
+            entry = [rule.selector_text, declarations or [], None]
+
+            if not mergeable:
+                entry[1] = []
+                entry[2] = rule.body
+                barrier_index = len(entries)
+            else:
+                # Last declaration of a property in the rule wins.
+                keys = [VisualQssOptimizer._property_key(name) for name, _ in declarations]
+                unique_declarations = [(name, value) for index, (name, value) in enumerate(declarations)
+                                       if keys[index] not in keys[index + 1:]]
+                report.dropped_declarations += len(declarations) - len(unique_declarations)
+                entry[1] = declarations = unique_declarations
+
+                previous_index = last_entry.get(rule.selector_text)
+
+                if previous_index is not None:
+                    previous_entry = entries[previous_index]
+                    overridden = set([VisualQssOptimizer._property_key(name) for name, _ in declarations])
+                    kept = []
+                    moved = []
+
+                    for name, value in previous_entry[1]:
+                        if VisualQssOptimizer._property_key(name) in overridden:
+                            report.dropped_declarations += 1
+                        elif (barrier_index > previous_index or
+                              family_entries[VisualQssOptimizer._family(name)][-1] > previous_index):
+                            # Set by a rule in between, it must stay before it.
+                            kept.append((name, value))
+                        else:
+                            moved.append((name, value))
+
+                    entry[1] = moved + declarations
+
+                    if kept:
+                        previous_entry[1] = kept
+                    else:
+                        entries[previous_index] = None
+                        report.merged_rules += 1
+
+                last_entry[rule.selector_text] = len(entries)
+
+            for name, _ in entry[1]:
+                family_entries.setdefault(VisualQssOptimizer._family(name), []).append(len(entries))
+
+            entries.append(entry)
+
+        rule_texts = []
+        for entry in entries:
+            if entry is None:
+                continue
+
+            if entry[2] is not None:
+                rule_texts.append('{}{{{}}}'.format(entry[0], entry[2]))
+            elif entry[1]:
+                rule_texts.append(VisualQssOptimizer._rule_text(entry[0], entry[1]))
+
+        output = '\n'.join(rule_texts)
+
+        report.output_size = len(output)
+        report.output_rules = len(rule_texts)
+
+        return output
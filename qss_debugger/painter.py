@@ -18,11 +18,37 @@
 
 from Qt import QtGui, QtCore, QtWidgets
 
+from qss_debugger.events import VisualTreeEventFilter
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualItemLayout(object):
+    # Everything drawn for one item, in parent coordinates. Labels are laid out
+    # once as (position, QStaticText), a cached paint only draws them.
+    __slots__ = ('item_rect', 'content_rect', 'lines', 'labels', 'bounds')
+
+    def __init__(self, item_rect, content_rect, lines, labels):
+        self.item_rect = item_rect
+        self.content_rect = content_rect
+        self.lines = lines
+        self.labels = labels
+
+        bounds = item_rect.united(content_rect)
+        for label_position, label_text in labels:
+            bounds = bounds.united(QtCore.QRectF(label_position, label_text.size()).toAlignedRect())
+
+        self.bounds = bounds.adjusted(-2, -2, 2, 2)
+
 
 # *********************************************************************
 # +++ CLASS
 # *********************************************************************
 class VisualTreePainter(QtWidgets.QWidget):
+    INVALIDATING_EVENTS = [QtCore.QEvent.Move, QtCore.QEvent.Resize, QtCore.QEvent.LayoutRequest,
+                           QtCore.QEvent.Show, QtCore.QEvent.Hide]
+
     # =====================================================================
     # +++ CONSTRUCTOR
     # =====================================================================
@@ -30,6 +56,25 @@ class VisualTreePainter(QtWidgets.QWidget):
         super(VisualTreePainter, self).__init__(parent)
         self._current_items = []
 
+        # Outlines of the widgets changed by the last style sheet, in parent
+        # coordinates, they are not updated when the widgets move.
+        self._changed_rects = []
+
+        # Item layouts are cached until the item or one of its ancestors moves or
+        # resizes, _watched maps each of those objects to the items depending on it.
+        self._layouts = {}
+        self._watched = {}
+        self._invalid_items = set()
+
+        self._invalidate_timer = QtCore.QTimer(self)
+        self._invalidate_timer.setSingleShot(True)
+        self._invalidate_timer.setInterval(0)
+        self._invalidate_timer.timeout.connect(self._update_invalid_items)
+
+        self._item_event_filter = VisualTreeEventFilter(self, dict([(event_type, self._item_geometry_changed)
+                                                                    for event_type in self.INVALIDATING_EVENTS]))
+        self._parent_event_filter = VisualTreeEventFilter(self, {QtCore.QEvent.Resize: self._parent_resized})
+
         # -- Style
         self._color_widget_rect = QtGui.QColor(255, 0, 0, 64)
         self._color_widget_content_rect = QtGui.QColor(255, 255, 255, 64)
@@ -37,11 +82,22 @@ class VisualTreePainter(QtWidgets.QWidget):
         self._brush_widget_rect = QtGui.QBrush(self._color_widget_rect)
         self._brush_widget_content_rect = QtGui.QBrush(self._color_widget_content_rect)
 
+        self._no_pen = QtGui.QPen(QtCore.Qt.NoPen)
+        self._margin_pen = QtGui.QPen(QtGui.QColor(255, 255, 255))
+        self._margin_pen.setWidth(1)
+        self._changed_pen = QtGui.QPen(QtGui.QColor(255, 200, 0, 192))
+        self._changed_pen.setWidth(1)
+
         self._text_font = QtGui.QFont("Arial", 8)
+        self._static_texts = {}
         self._margin_label_height = 24
 
         self.setAttribute(QtCore.Qt.WA_TransparentForMouseEvents)
 
+        if parent:
+            self.setFixedSize(parent.size())
+            parent.installEventFilter(self._parent_event_filter)
+
     # ====================================================================
     # +++ PROPERTIES
     # =====================================================================
@@ -51,124 +107,270 @@ class VisualTreePainter(QtWidgets.QWidget):
 
     @current_items.setter
     def current_items(self, items):
-        self._current_items = items
-        self.update()
-
-    # ====================================================================
-    # +++ OVERRIDES
-    # =====================================================================
-    def paintEvent(self, event):
-        self.setFixedSize(self.parent().size())
-
-        painter = QtGui.QPainter(self)
-        painter.setPen(QtCore.Qt.NoPen)
+        old_items = set(self._current_items)
+        new_items = set(items)
 
-        for item in self._current_items:
-            if not isinstance(item, QtWidgets.QWidget):
-                return
+        for item in old_items - new_items:
+            self._update_item(item)
+            self._layouts.pop(item, None)
 
-            # Reset painter
-            painter.setPen(QtCore.Qt.NoPen)
-
-            # Widget Rect
-            # This property holds the internal geometry of the widget excluding any window frame.
-            # The rect property equals:
-            # PySide.QtCore.QRect (0, 0, PySide.QtGui.QWidget.width() , PySide.QtGui.QWidget.height() ).
-            item_rect = QtCore.QRect(item.rect())
-            top_left = item.mapTo(self.parent(), item_rect.topLeft())
-            bottom_right = item.mapTo(self.parent(), item_rect.bottomRight())
+        self._current_items = items
+        self._watch_items()
 
-            item_rect.setTopLeft(top_left)
-            item_rect.setBottomRight(bottom_right)
+        for item in new_items - old_items:
+            self._update_item(item)
 
-            painter.setBrush(self._brush_widget_rect)
-            painter.drawRect(item_rect)
+    @property
+    def changed_rects(self):
+        return self._changed_rects
 
-            # Content Rect
-            # Returns the area inside the widget's margins.
-            content_rect = QtCore.QRect(item.contentsRect())
-            top_left = item.mapTo(self.parent(), content_rect.topLeft())
-            bottom_right = item.mapTo(self.parent(), content_rect.bottomRight())
+    @changed_rects.setter
+    def changed_rects(self, rects):
+        if rects or self._changed_rects:
+            self._changed_rects = rects
+            self.update()
 
-            content_rect.setTopLeft(top_left)
-            content_rect.setBottomRight(bottom_right)
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _watch_items(self):
+        watched = {}
 
-            painter.setBrush(self._brush_widget_content_rect)
-            painter.drawRect(content_rect)
+        for item in self._current_items:
+            if not isinstance(item, QtWidgets.QWidget):
+                continue
+
+            ancestor = item
+            while ancestor is not None and ancestor is not self.parent():
+                watched.setdefault(ancestor, set()).add(item)
+                ancestor = ancestor.parentWidget()
 
-            # Margin Indicators
-            margin_pen = QtGui.QPen(QtGui.QColor(255, 255, 255))
-            margin_pen.setWidth(1)
+        for obj in set(self._watched) - set(watched):
+            try:
+                obj.removeEventFilter(self._item_event_filter)
+            except RuntimeError:
+                pass
+
+        for obj in set(watched) - set(self._watched):
+            obj.installEventFilter(self._item_event_filter)
+
+        self._watched = watched
+
+    def _item_layout(self, item):
+        item_layout = self._layouts.get(item)
+
+        if item_layout is None:
+            try:
+                item_layout = self._layout_item(item)
+            except RuntimeError:
+                # The item was deleted.
+                return None
+
+            self._layouts[item] = item_layout
+
+        return item_layout
+
+    def _update_item(self, item):
+        item_layout = self._item_layout(item) if isinstance(item, QtWidgets.QWidget) else None
+
+        if item_layout is not None:
+            self.update(item_layout.bounds)
+
+    def _invalidate(self, items):
+        # The old area is repainted now, the new one once the geometry settled.
+        for item in items:
+            item_layout = self._layouts.pop(item, None)
+
+            if item_layout is not None:
+                self.update(item_layout.bounds)
+
+        self._invalid_items.update(items)
+        self._invalidate_timer.start()
+
+    def _static_text(self, text):
+        # Margins repeat a lot, every distinct text is laid out once.
+        static_text = self._static_texts.get(text)
+
+        if static_text is None:
+            static_text = QtGui.QStaticText(text)
+            static_text.setTextFormat(QtCore.Qt.PlainText)
+            static_text.prepare(QtGui.QTransform(), self._text_font)
+            self._static_texts[text] = static_text
+
+        return static_text
+
+    def _static_label(self, label_rect, label_flags, label_text):
+        # (position, QStaticText) drawn where drawText would align it in label_rect.
+        static_text = self._static_text(label_text)
+        text_size = static_text.size()
+
+        if label_flags & QtCore.Qt.AlignRight:
+            x = label_rect.right() - text_size.width()
+        elif label_flags & QtCore.Qt.AlignHCenter:
+            x = label_rect.center().x() - text_size.width() / 2.0
+        else:
+            x = label_rect.left()
+
+        if label_flags & QtCore.Qt.AlignBottom:
+            y = label_rect.bottom() - text_size.height()
+        elif label_flags & QtCore.Qt.AlignVCenter:
+            y = label_rect.center().y() - text_size.height() / 2.0
+        else:
+            y = label_rect.top()
+
+        return QtCore.QPointF(x, y), static_text
+
+    def _layout_item(self, item):
+        # Widget Rect
+        # This property holds the internal geometry of the widget excluding any window frame.
+        # The rect property equals:
+        # PySide.QtCore.QRect (0, 0, PySide.QtGui.QWidget.width() , PySide.QtGui.QWidget.height() ).
+        item_rect = QtCore.QRect(item.rect())
+        top_left = item.mapTo(self.parent(), item_rect.topLeft())
+        bottom_right = item.mapTo(self.parent(), item_rect.bottomRight())
+
+        item_rect.setTopLeft(top_left)
+        item_rect.setBottomRight(bottom_right)
+
+        # Content Rect
+        # Returns the area inside the widget's margins.
+        content_rect = QtCore.QRect(item.contentsRect())
+        top_left = item.mapTo(self.parent(), content_rect.topLeft())
+        bottom_right = item.mapTo(self.parent(), content_rect.bottomRight())
+
+        content_rect.setTopLeft(top_left)
+        content_rect.setBottomRight(bottom_right)
+
+        lines = []
+        labels = []
+
+        # Left margin
+        content_left = QtCore.QPointF(content_rect.left(), item_rect.center().y())
+        item_left = QtCore.QPointF(item_rect.left(), item_rect.center().y())
+        margin_left = abs(content_rect.left() - item_rect.left())
 
-            painter.setPen(margin_pen)
-            painter.setFont(self._text_font)
+        label_left_rect = QtCore.QRectF(content_left.x() + 2,
+                                        content_left.y() - self._margin_label_height / 2.0,
+                                        content_rect.width() / 2.0,
+                                        self._margin_label_height)
 
-            # Left margin
-            content_left = QtCore.QPointF(content_rect.left(), item_rect.center().y())
-            item_left = QtCore.QPointF(item_rect.left(), item_rect.center().y())
-            margin_left = abs(content_rect.left() - item_rect.left())
+        lines.append((item_left, content_left))
+        labels.append((label_left_rect, QtCore.Qt.AlignVCenter, str(margin_left)))
+
+        # Right margin
+        content_right = QtCore.QPointF(content_rect.right(), item_rect.center().y())
+        item_right = QtCore.QPointF(item_rect.right(), item_rect.center().y())
+        margin_right = abs(content_rect.right() - item_rect.right())
+
+        label_right_rect = QtCore.QRectF(content_right.x() - content_rect.width() / 2.0 - 2,
+                                         content_right.y() - self._margin_label_height / 2.0,
+                                         content_rect.width() / 2.0,
+                                         self._margin_label_height)
+
+        lines.append((item_right, content_right))
+        labels.append((label_right_rect, QtCore.Qt.AlignVCenter | QtCore.Qt.AlignRight, str(margin_right)))
+
+        # Top margin
+        content_top = QtCore.QPointF(item_rect.center().x(), content_rect.top())
+        item_top = QtCore.QPointF(item_rect.center().x(), item_rect.top())
+        margin_top = abs(content_rect.top() - item_rect.top())
+
+        label_top_rect = QtCore.QRectF(content_top.x() - (content_rect.width() / 2.0) / 2.0,
+                                       content_top.y() + 2.0,
+                                       content_rect.width() / 2.0,
+                                       self._margin_label_height)
+
+        lines.append((item_top, content_top))
+        labels.append((label_top_rect, QtCore.Qt.AlignHCenter, str(margin_top)))
+
+        # Bottom margin
+        content_bottom = QtCore.QPointF(item_rect.center().x(), content_rect.bottom())
+        item_bottom = QtCore.QPointF(item_rect.center().x(), item_rect.bottom())
+        margin_bottom = abs(content_rect.bottom() - item_rect.bottom())
+
+        label_bottom_rect = QtCore.QRectF(content_bottom.x() - (content_rect.width() / 2.0) / 2.0,
+                                          content_bottom.y() - self._margin_label_height - 2.0,
+                                          content_rect.width() / 2.0,
+                                          self._margin_label_height)
+
+        lines.append((item_bottom, content_bottom))
+        labels.append((label_bottom_rect, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignBottom, str(margin_bottom)))
+
+        # Center
+        line_length = 2.0
+        vertical_x = item_rect.center().x()
+        vertical_y0 = item_rect.center().y() - line_length
+        vertical_y1 = item_rect.center().y() + line_length
+
+        horizontal_y = item_rect.center().y()
+        horizontal_x0 = item_rect.center().x() - line_length
+        horizontal_x1 = item_rect.center().x() + line_length
+
+        lines.append((QtCore.QPointF(vertical_x, vertical_y0), QtCore.QPointF(vertical_x, vertical_y1)))
+        lines.append((QtCore.QPointF(horizontal_x0, horizontal_y), QtCore.QPointF(horizontal_x1, horizontal_y)))
+
+        lines = [QtCore.QLineF(line_start, line_end) for line_start, line_end in lines]
+        labels = [self._static_label(label_rect, label_flags, label_text)
+                  for label_rect, label_flags, label_text in labels]
+
+        return VisualItemLayout(item_rect, content_rect, lines, labels)
 
-            label_left_rect = QtCore.QRectF(content_left.x() + 2,
-                                            content_left.y() - self._margin_label_height / 2.0,
-                                            content_rect.width() / 2.0,
-                                            self._margin_label_height)
+    # ====================================================================
+    # +++ OVERRIDES
+    # =====================================================================
+    def paintEvent(self, event):
+        dirty_rect = event.rect()
 
-            painter.drawLine(item_left, content_left)
-            painter.drawText(label_left_rect, QtCore.Qt.AlignVCenter, str(margin_left))
+        painter = QtGui.QPainter(self)
+        painter.setFont(self._text_font)
 
-            # Right margin
-            content_right = QtCore.QPointF(content_rect.right(), item_rect.center().y())
-            item_right = QtCore.QPointF(item_rect.right(), item_rect.center().y())
-            margin_right = abs(content_rect.right() - item_rect.right())
+        if self._changed_rects:
+            painter.setPen(self._changed_pen)
+            painter.setBrush(QtCore.Qt.NoBrush)
+            painter.drawRects(self._changed_rects)
 
-            label_right_rect = QtCore.QRectF(content_right.x() - content_rect.width() / 2.0 - 2,
-                                             content_right.y() - self._margin_label_height / 2.0,
-                                             content_rect.width() / 2.0,
-                                             self._margin_label_height)
+        for item in self._current_items:
+            if not isinstance(item, QtWidgets.QWidget):
+                continue
 
-            painter.drawLine(item_right, content_right)
-            painter.drawText(label_right_rect, QtCore.Qt.AlignVCenter | QtCore.Qt.AlignRight, str(margin_right))
+            item_layout = self._item_layout(item)
 
-            # Top margin
-            content_top = QtCore.QPointF(item_rect.center().x(), content_rect.top())
-            item_top = QtCore.QPointF(item_rect.center().x(), item_rect.top())
-            margin_top = abs(content_rect.top() - item_rect.top())
+            if item_layout is None or not item_layout.bounds.intersects(dirty_rect):
+                continue
 
-            label_top_rect = QtCore.QRectF(content_top.x() - (content_rect.width() / 2.0) / 2.0,
-                                           content_top.y() + 2.0,
-                                           content_rect.width() / 2.0,
-                                           self._margin_label_height)
+            painter.setPen(self._no_pen)
+            painter.setBrush(self._brush_widget_rect)
+            painter.drawRect(item_layout.item_rect)
 
-            painter.drawLine(item_top, content_top)
-            painter.drawText(label_top_rect, QtCore.Qt.AlignHCenter, str(margin_top))
+            painter.setBrush(self._brush_widget_content_rect)
+            painter.drawRect(item_layout.content_rect)
 
-            # Bottom margin
-            content_bottom = QtCore.QPointF(item_rect.center().x(), content_rect.bottom())
-            item_bottom = QtCore.QPointF(item_rect.center().x(), item_rect.bottom())
-            margin_bottom = abs(content_rect.bottom() - item_rect.bottom())
+            # Margin Indicators
+            painter.setPen(self._margin_pen)
 
-            label_bottom_rect = QtCore.QRectF(content_bottom.x() - (content_rect.width() / 2.0) / 2.0,
-                                              content_bottom.y() - self._margin_label_height - 2.0,
-                                              content_rect.width() / 2.0,
-                                              self._margin_label_height)
+            painter.drawLines(item_layout.lines)
 
-            painter.drawLine(item_bottom, content_bottom)
-            painter.drawText(label_bottom_rect, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignBottom, str(margin_bottom))
+            for label_position, label_text in item_layout.labels:
+                painter.drawStaticText(label_position, label_text)
 
-            # Draw Center
-            line_length = 2.0
-            vertical_x = item_rect.center().x()
-            vertical_y0 = item_rect.center().y() - line_length
-            vertical_y1 = item_rect.center().y() + line_length
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _parent_resized(self, obj, event):
+        # Items are laid out relative to the parent, only its size matters.
+        self.setFixedSize(self.parent().size())
+        self._invalidate([item for item in self._current_items if item in self._layouts])
 
-            horizontal_y = item_rect.center().y()
-            horizontal_x0 = item_rect.center().x() - line_length
-            horizontal_x1 = item_rect.center().x() + line_length
+    def _item_geometry_changed(self, obj, event):
+        items = self._watched.get(obj)
 
-            painter.drawLine(QtCore.QPointF(vertical_x, vertical_y0),
-                             QtCore.QPointF(vertical_x, vertical_y1))
+        if items:
+            self._invalidate(items)
 
-            painter.drawLine(QtCore.QPointF(horizontal_x0, horizontal_y),
-                             QtCore.QPointF(horizontal_x1, horizontal_y))
+    def _update_invalid_items(self):
+        invalid_items = self._invalid_items
+        self._invalid_items = set()
 
-        return
+        for item in invalid_items:
+            if item in self._watched:
+                self._update_item(item)
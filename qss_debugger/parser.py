@@ -0,0 +1,449 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import re
+import bisect
+
+from future.utils import iteritems
+
+
+# *********************************************************************
+# +++ CONSTANTS
+# *********************************************************************
+COMBINATOR_DESCENDANT = ' '
+COMBINATOR_CHILD = '>'
+
+_COMMENT_PATTERN = re.compile(r'/\*.*?\*/', re.DOTALL)
+_RULE_PATTERN = re.compile(r'([^{}]*)\{([^{}]*)\}')
+_SELECTOR_TOKEN_PATTERN = re.compile(r'>|(?:[^\s>\[]+|\[[^\]]*\])+')
+_SIMPLE_SELECTOR_PATTERN = re.compile(r'\*|[A-Za-z_][\w-]*|#[\w-]+|\.[\w-]+|\[[^\]]*\]|::?!?[\w-]+')
+_ATTRIBUTE_PATTERN = re.compile(r'\[\s*([\w-]+)\s*(?:(=|~=|\|=)\s*("[^"]*"|\'[^\']*\'|[^\]\s]*))?\s*\]$')
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssCompound(object):
+    # One step of a selector, e.g. QPushButton#ok[flat="true"]:hover
+    __slots__ = ('type_name', 'object_name', 'class_names', 'attributes', 'pseudo', 'head', 'tail')
+
+    def __init__(self):
+        self.type_name = None
+        self.object_name = None
+        self.class_names = []
+        self.attributes = []
+        self.pseudo = []
+        self.head = ''
+        self.tail = ''
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def property_text(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+
+        return str(value)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def matches(self, obj):
+        # Pseudo states and sub controls are ignored, the widget matches if it can
+        # be in that state.
+        if self.type_name and self.type_name != '*' and not obj.inherits(self.type_name):
+            return False
+
+        if self.object_name is not None and obj.objectName() != self.object_name:
+            return False
+
+        for class_name in self.class_names:
+            if obj.metaObject().className() != class_name:
+                return False
+
+        for name, operator, value in self.attributes:
+            property_value = obj.property(name)
+
+            if property_value is None:
+                return False
+
+            if operator is None:
+                continue
+
+            if isinstance(property_value, (list, tuple)):
+                property_values = [self.property_text(v) for v in property_value]
+            else:
+                property_values = [self.property_text(property_value)]
+
+            if operator == '=' and value not in property_values:
+                return False
+
+            if operator == '~=' and value not in ' '.join(property_values).split():
+                return False
+
+            if operator == '|=' and not any(v == value or v.startswith(value + '-') for v in property_values):
+                return False
+
+        return True
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssSelector(object):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, text):
+        self.text = ' '.join(text.split())
+        self.valid = True
+        self.rule = None
+
+        # [(combinator to the previous compound, compound)], the first combinator is None.
+        self.compounds = []
+        self._parse()
+
+        # CSS2 specificity: (object names, classes attributes and states, types and sub controls)
+        self.specificity = (
+            sum([compound.object_name is not None for _, compound in self.compounds]),
+            sum([len(compound.class_names) + len(compound.attributes) +
+                 len([p for p in compound.pseudo if not p.startswith('::')])
+                 for _, compound in self.compounds]),
+            sum([(compound.type_name not in [None, '*']) +
+                 len([p for p in compound.pseudo if p.startswith('::')])
+                 for _, compound in self.compounds]))
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _parse(self):
+        combinator = None
+
+        for token in _SELECTOR_TOKEN_PATTERN.findall(self.text):
+            if token == COMBINATOR_CHILD:
+                if combinator != COMBINATOR_DESCENDANT:
+                    self.valid = False
+                combinator = COMBINATOR_CHILD
+                continue
+
+            compound = self._parse_compound(token)
+            if compound is None:
+                self.valid = False
+                return
+
+            self.compounds.append((combinator if self.compounds else None, compound))
+            combinator = COMBINATOR_DESCENDANT
+
+        if not self.compounds or combinator == COMBINATOR_CHILD:
+            self.valid = False
+
+    def _parse_compound(self, text):
+        compound = VisualQssCompound()
+        position = 0
+        tail_start = len(text)
+
+        for match in _SIMPLE_SELECTOR_PATTERN.finditer(text):
+            if match.start() != position:
+                return None
+
+            token = match.group(0)
+            position = match.end()
+
+            if token.startswith(':'):
+                tail_start = min(tail_start, match.start())
+                compound.pseudo.append(token)
+                continue
+
+            # Pseudo states and sub controls must come last.
+            if compound.pseudo:
+                return None
+
+            if token.startswith('#'):
+                compound.object_name = token[1:]
+            elif token.startswith('.'):
+                compound.class_names.append(token[1:])
+            elif token.startswith('['):
+                attribute_match = _ATTRIBUTE_PATTERN.match(token)
+                if not attribute_match:
+                    return None
+
+                name, operator, value = attribute_match.groups()
+                if value and value[0] in '"\'':
+                    value = value[1:-1]
+
+                compound.attributes.append((name, operator, value))
+            elif match.start() == 0:
+                compound.type_name = token
+            else:
+                return None
+
+        if position != len(text):
+            return None
+
+        compound.head = text[:tail_start]
+        compound.tail = text[tail_start:]
+
+        return compound
+
+    def _matches_from(self, obj, index):
+        combinator, compound = self.compounds[index]
+
+        if not compound.matches(obj):
+            return False
+
+        if index == 0:
+            return True
+
+        parent = obj.parent()
+
+        if combinator == COMBINATOR_CHILD:
+            return parent is not None and self._matches_from(parent, index - 1)
+
+        while parent is not None:
+            if self._matches_from(parent, index - 1):
+                return True
+            parent = parent.parent()
+
+        return False
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def matches(self, obj):
+        return self.valid and self._matches_from(obj, len(self.compounds) - 1)
+
+    @property
+    def key_compound(self):
+        return self.compounds[-1][1] if self.compounds else None
+
+    def scoped(self, attribute):
+        # The selector restricted to widgets carrying the given attribute selector.
+        parts = []
+
+        for index, (combinator, compound) in enumerate(self.compounds):
+            if combinator == COMBINATOR_CHILD:
+                parts.append('>')
+
+            if index == len(self.compounds) - 1:
+                parts.append(compound.head + attribute + compound.tail)
+            else:
+                parts.append(compound.head + compound.tail)
+
+        return ' '.join(parts)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssRule(object):
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, selector_text, body, line, index=0):
+        self.selector_text = ' '.join(selector_text.split())
+        self.selectors = [VisualQssSelector(text) for text in self.selector_text.split(',')]
+        self.body = body.strip()
+        self.line = line
+        self.index = index
+
+        # Source segment the rule was compiled from and its line in that segment.
+        self.segment = None
+        self.segment_line = line
+
+        for selector in self.selectors:
+            selector.rule = self
+
+        self.declarations = []
+        for declaration in self.body.split(';'):
+            name, separator, value = declaration.partition(':')
+            if separator:
+                self.declarations.append((name.strip().lower(), value.strip()))
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def valid(self):
+        return all(selector.valid for selector in self.selectors)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def matches(self, obj):
+        return any(selector.matches(obj) for selector in self.selectors)
+
+    def to_text(self):
+        return '{} {{ {} }}'.format(self.selector_text, self.body)
+
+    @property
+    def source(self):
+        if self.segment is None:
+            return 'line {}'.format(self.line)
+
+        return '{}:{}'.format(self.segment, self.segment_line)
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssParser(object):
+    @staticmethod
+    def _blank_comment(match):
+        # Comments are replaced by their line breaks so rule lines stay accurate.
+        return '\n' * match.group(0).count('\n')
+
+    @staticmethod
+    def parse(content, segment_lines=None):
+        # segment_lines is a sorted list of (first line, segment name) of the
+        # compiled content, used to give every rule its source segment.
+        content = _COMMENT_PATTERN.sub(VisualQssParser._blank_comment, content)
+        rules = []
+        line = 1
+        position = 0
+
+        for match in _RULE_PATTERN.finditer(content):
+            selector_text = match.group(1)
+            selector_start = match.start(1) + len(selector_text) - len(selector_text.lstrip())
+
+            line += content.count('\n', position, selector_start)
+            position = selector_start
+
+            if selector_text.strip():
+                rules.append(VisualQssRule(selector_text, match.group(2), line, len(rules)))
+
+        if segment_lines:
+            first_lines = [first_line for first_line, _ in segment_lines]
+
+            for rule in rules:
+                segment_index = bisect.bisect_right(first_lines, rule.line) - 1
+
+                if segment_index >= 0:
+                    first_line, rule.segment = segment_lines[segment_index]
+                    rule.segment_line = rule.line - first_line + 1
+
+        return rules
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualQssRuleIndex(object):
+    # Selectors are bucketed by the most selective part of their rightmost compound
+    # (object name, exact class, property value, type, property name) so a widget is only tested
+    # against the selectors that can possibly match it.
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, rules):
+        self._rules = rules
+        self._object_names = {}
+        self._class_names = {}
+        self._type_names = {}
+        self._attribute_names = {}
+        self._attribute_values = {}
+        self._universal = []
+        self._invalid = []
+
+        for rule in rules:
+            for selector in rule.selectors:
+                self._add(selector)
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _add(self, selector):
+        if not selector.valid:
+            self._invalid.append(selector)
+            return
+
+        compound = selector.key_compound
+
+        values = [(name, value) for name, operator, value in compound.attributes if operator == '=']
+
+        if compound.object_name is not None:
+            self._object_names.setdefault(compound.object_name, []).append(selector)
+        elif compound.class_names:
+            self._class_names.setdefault(compound.class_names[0], []).append(selector)
+        elif values:
+            self._attribute_values.setdefault(values[0][0], {}).setdefault(values[0][1], []).append(selector)
+        elif compound.type_name not in [None, '*']:
+            self._type_names.setdefault(compound.type_name, []).append(selector)
+        elif compound.attributes:
+            self._attribute_names.setdefault(compound.attributes[0][0], []).append(selector)
+        else:
+            self._universal.append(selector)
+
+    def _candidates(self, obj):
+        candidates = list(self._universal)
+        candidates.extend(self._object_names.get(obj.objectName(), []))
+
+        meta_object = obj.metaObject()
+        candidates.extend(self._class_names.get(meta_object.className(), []))
+
+        while meta_object is not None:
+            candidates.extend(self._type_names.get(meta_object.className(), []))
+            meta_object = meta_object.superClass()
+
+        for name, selectors in iteritems(self._attribute_names):
+            if obj.property(name) is not None:
+                candidates.extend(selectors)
+
+        for name, value_selectors in iteritems(self._attribute_values):
+            property_value = obj.property(name)
+
+            if property_value is None:
+                continue
+
+            if not isinstance(property_value, (list, tuple)):
+                property_value = [property_value]
+
+            for value in property_value:
+                candidates.extend(value_selectors.get(VisualQssCompound.property_text(value), []))
+
+        return candidates
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def rules(self):
+        return self._rules
+
+    @property
+    def invalid_selectors(self):
+        return list(self._invalid)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def match(self, obj):
+        # Matching selectors in cascade order: lowest specificity first, then source order.
+        selectors = [selector for selector in self._candidates(obj) if selector.matches(obj)]
+        selectors.sort(key=lambda selector: (selector.specificity, selector.rule.index))
+
+        return selectors
+
+    def match_rules(self, obj):
+        rules = []
+
+        for selector in self.match(obj):
+            if selector.rule not in rules:
+                rules.append(selector.rule)
+
+        return rules
@@ -0,0 +1,194 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import json
+import time
+
+from future.utils import iteritems
+
+from Qt import QtCore, QtWidgets
+
+from qss_debugger.compiler import clock
+from qss_debugger.events import VisualTreeEventFilter
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualProfileReport(object):
+    # Times are stored in milliseconds, rankings are lists of (name, ms) slowest first.
+    VERSION = 1
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self):
+        self.timestamp = time.time()
+        self.stages = []
+        self.widgets = []
+        self.subtrees = []
+        self.segments = []
+        self.widget_count = 0
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def add_stage(self, name, seconds):
+        self.stages.append((name, seconds * 1000.0))
+
+    def to_dict(self):
+        return {'version': self.VERSION,
+                'timestamp': self.timestamp,
+                'widget_count': self.widget_count,
+                'stages': [{'name': name, 'ms': ms} for name, ms in self.stages],
+                'widgets': [{'name': name, 'ms': ms} for name, ms in self.widgets],
+                'subtrees': [{'name': name, 'ms': ms} for name, ms in self.subtrees],
+                'segments': [{'name': name, 'ms': ms} for name, ms in self.segments]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def save(self, file_path):
+        with open(file_path, 'w') as file_handle:
+            file_handle.write(self.to_json())
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualStyleProfiler(object):
+    # Qt re-polishes widgets one after another and sends each one a StyleChange event
+    # (Polish the first time), the time between two of those events is attributed
+    # to the first widget.
+    PROFILED_EVENTS = [QtCore.QEvent.Polish, QtCore.QEvent.StyleChange]
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, root, ranking_size=20):
+        self._root = root
+        self._ranking_size = ranking_size
+        self._samples = []
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def widget_name(widget):
+        name = widget.metaObject().className()
+
+        if widget.objectName():
+            name += '#' + widget.objectName()
+
+        return name
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _record(self, obj, event):
+        if obj.isWidgetType():
+            self._samples.append((clock(), obj))
+
+        return False
+
+    def _widget_path(self, widget, paths):
+        path = paths.get(widget)
+
+        if path is None:
+            parent = widget.parentWidget() if widget is not self._root else None
+            path = self.widget_name(widget)
+
+            if parent is not None:
+                path = self._widget_path(parent, paths) + '/' + path
+
+            paths[widget] = path
+
+        return path
+
+    def _rank(self, costs):
+        ranking = sorted(costs.items(), key=lambda item: item[1], reverse=True)
+        return ranking[:self._ranking_size]
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def profile(self, apply_function, report=None, rule_index=None):
+        report = report if report is not None else VisualProfileReport()
+        application = QtWidgets.QApplication.instance()
+
+        self._samples = []
+        event_filter = VisualTreeEventFilter(None, dict([(event_type, self._record)
+                                                         for event_type in self.PROFILED_EVENTS]))
+        application.installEventFilter(event_filter)
+
+        start_time = clock()
+        try:
+            apply_function()
+        finally:
+            end_time = clock()
+            application.removeEventFilter(event_filter)
+
+        samples = self._samples
+        self._samples = []
+
+        # Cost of every widget, a widget can be polished more than once.
+        widget_costs = {}
+        for index, (sample_time, widget) in enumerate(samples):
+            next_time = samples[index + 1][0] if index + 1 < len(samples) else end_time
+            widget_costs[widget] = widget_costs.get(widget, 0.0) + (next_time - sample_time) * 1000.0
+
+        first_time = samples[0][0] if samples else end_time
+        report.add_stage('qt_apply_setup', first_time - start_time)
+        report.add_stage('qt_polish', end_time - first_time)
+        report.add_stage('qt_apply', end_time - start_time)
+        report.widget_count = len(widget_costs)
+
+        paths = {}
+        widgets = {}
+        subtrees = {}
+        segments = {}
+
+        for widget, cost in iteritems(widget_costs):
+            try:
+                path = self._widget_path(widget, paths)
+            except RuntimeError:
+                continue
+
+            widgets[path] = widgets.get(path, 0.0) + cost
+
+            ancestor = widget
+            while ancestor is not None:
+                ancestor_path = self._widget_path(ancestor, paths)
+                subtrees[ancestor_path] = subtrees.get(ancestor_path, 0.0) + cost
+
+                if ancestor is self._root:
+                    break
+                ancestor = ancestor.parentWidget()
+
+            # The cost is shared by the segments of the rules matching the widget.
+            if rule_index is not None:
+                widget_segments = set([rule.segment or 'line {}'.format(rule.line)
+                                       for rule in rule_index.match_rules(widget)])
+
+                for segment in widget_segments:
+                    segments[segment] = segments.get(segment, 0.0) + cost / len(widget_segments)
+
+        report.widgets = self._rank(widgets)
+        report.subtrees = self._rank(subtrees)
+        report.segments = self._rank(segments)
+
+        return report
@@ -0,0 +1,358 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import heapq
+import itertools
+
+from future.utils import iteritems
+
+from Qt import QtCore
+
+from qss_debugger.compiler import clock
+from qss_debugger.events import VisualTreeEventFilter
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualSearchIndex(QtCore.QObject):
+    # Inverted index of the objects under root, {field: {value: objects}}, values
+    # are lower case. A query scans the distinct values instead of the objects, a
+    # few hundred class names stand for thousands of widgets. Objects are indexed
+    # in steps of INDEX_STEP_TIME seconds so the first search doesn't block the
+    # ui, children, dynamic property and object name changes are patched once per
+    # event loop iteration.
+    FIELDS = ['type', 'name', 'property', 'class']
+    STYLE_CLASS_PROPERTY = 'class'
+    INDEX_STEP_TIME = 0.02
+
+    changed = QtCore.Signal()
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None):
+        super(VisualSearchIndex, self).__init__(parent)
+        self._root = None
+        self._started = False
+
+        self._values = dict([(field, {}) for field in self.FIELDS])
+        self._object_values = {}
+        self._children = {}
+
+        # Indexing order, the tree order as long as nothing is added later.
+        self._order = {}
+        self._counter = itertools.count()
+
+        # Objects waiting to be indexed, with their descendants.
+        self._pending = []
+        self._index_timer = QtCore.QTimer(self)
+        self._index_timer.setInterval(0)
+        self._index_timer.timeout.connect(self._index_step)
+
+        self._dirty_values = set()
+        self._dirty_children = set()
+        self._flush_timer = QtCore.QTimer(self)
+        self._flush_timer.setSingleShot(True)
+        self._flush_timer.setInterval(0)
+        self._flush_timer.timeout.connect(self._flush_changes)
+
+        self._event_filter = VisualTreeEventFilter(self, {QtCore.QEvent.ChildAdded: self._children_changed,
+                                                          QtCore.QEvent.ChildRemoved: self._children_changed,
+                                                          QtCore.QEvent.DynamicPropertyChange: self._values_changed})
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def object_values(obj):
+        # [(field, value)] of one object.
+        type_name = obj.metaObject().className()
+        values = [('type', type_name.lower())]
+
+        if type(obj).__name__ != type_name:
+            values.append(('type', type(obj).__name__.lower()))
+
+        if obj.objectName():
+            values.append(('name', obj.objectName().lower()))
+
+        for property_name in obj.dynamicPropertyNames():
+            property_name = property_name.data().decode('utf-8')
+            property_value = u'{}'.format(obj.property(property_name)).lower()
+            values.append(('property', u'{}={}'.format(property_name.lower(), property_value)))
+
+            if property_name == VisualSearchIndex.STYLE_CLASS_PROPERTY:
+                values.extend([('class', style_class) for style_class in property_value.split()])
+
+        return values
+
+    @staticmethod
+    def parse_query(text):
+        # [(field or None, needle)], 'field:needle' limits a term to one field.
+        terms = []
+
+        for term in text.lower().split():
+            field, _, needle = term.partition(':')
+
+            if needle and field in VisualSearchIndex.FIELDS:
+                terms.append((field, needle))
+            else:
+                terms.append((None, term))
+
+        return terms
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _add_values(self, obj):
+        values = self.object_values(obj)
+        self._object_values[obj] = values
+
+        for field, value in values:
+            self._values[field].setdefault(value, set()).add(obj)
+
+    def _remove_values(self, obj):
+        for field, value in self._object_values.pop(obj, []):
+            field_values = self._values[field]
+            objs = field_values.get(value)
+
+            if objs is not None:
+                objs.discard(obj)
+
+                if not objs:
+                    del field_values[value]
+
+    def _watch(self, obj):
+        obj.installEventFilter(self._event_filter)
+        obj.objectNameChanged.connect(self._name_changed)
+
+    def _unwatch(self, obj):
+        try:
+            obj.removeEventFilter(self._event_filter)
+            obj.objectNameChanged.disconnect(self._name_changed)
+        except (RuntimeError, TypeError):
+            # Deleted or not connected.
+            pass
+
+    def _add_subtree(self, obj):
+        self._pending.append(obj)
+        self._index_timer.start()
+
+    def _add_object(self, obj):
+        # Skip objects indexed twice or removed from the tree while pending.
+        if obj in self._object_values or (obj is not self._root and obj.parent() not in self._object_values):
+            return
+
+        children = obj.children()
+
+        self._add_values(obj)
+        self._order[obj] = next(self._counter)
+        self._children[obj] = set(children)
+        self._watch(obj)
+
+        self._pending.extend(reversed(children))
+
+    def _remove_subtree(self, obj):
+        stack = [obj]
+
+        while stack:
+            obj = stack.pop()
+            stack.extend(self._children.pop(obj, []))
+
+            # Children of the last indexed objects may still be pending, unwatched.
+            if obj not in self._object_values:
+                continue
+
+            self._remove_values(obj)
+            self._order.pop(obj, None)
+            self._dirty_values.discard(obj)
+            self._dirty_children.discard(obj)
+            self._unwatch(obj)
+
+    def _update_children(self, obj):
+        try:
+            children = set(obj.children())
+        except RuntimeError:
+            children = set()
+
+        indexed_children = self._children.get(obj, set())
+
+        for child in indexed_children - children:
+            self._remove_subtree(child)
+
+        for child in children - indexed_children:
+            if child not in self._object_values:
+                self._add_subtree(child)
+
+        self._children[obj] = children
+
+    def _index_pending(self):
+        # Indexes pending objects for up to INDEX_STEP_TIME, returns whether all of
+        # them are done.
+        end_time = clock() + self.INDEX_STEP_TIME
+
+        while self._pending and clock() < end_time:
+            obj = self._pending.pop()
+
+            try:
+                self._add_object(obj)
+            except RuntimeError:
+                # Deleted while pending.
+                continue
+
+        if self._pending:
+            return False
+
+        self._index_timer.stop()
+        return True
+
+    def _flush(self):
+        # Returns whether anything was patched.
+        if not self._dirty_values and not self._dirty_children:
+            return False
+
+        dirty_children = self._dirty_children
+        self._dirty_children = set()
+
+        for obj in dirty_children:
+            if obj in self._object_values:
+                self._update_children(obj)
+
+        dirty_values = self._dirty_values
+        self._dirty_values = set()
+
+        for obj in dirty_values:
+            if obj in self._object_values:
+                self._remove_values(obj)
+
+                try:
+                    self._add_values(obj)
+                except RuntimeError:
+                    self._remove_subtree(obj)
+
+        return True
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def is_started(self):
+        return self._started
+
+    @property
+    def size(self):
+        return len(self._object_values)
+
+    @property
+    def is_indexing(self):
+        return bool(self._pending)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def set_root(self, root):
+        # Nothing is read until the first search.
+        self.stop()
+        self._root = root
+
+    def start(self):
+        if self._started or self._root is None:
+            return
+
+        self._started = True
+        self._add_subtree(self._root)
+
+    def stop(self):
+        if self._root is not None and self._started:
+            self._remove_subtree(self._root)
+
+        self._values = dict([(field, {}) for field in self.FIELDS])
+        self._object_values = {}
+        self._children = {}
+        self._order = {}
+        self._pending = []
+        self._index_timer.stop()
+        self._dirty_values = set()
+        self._dirty_children = set()
+        self._started = False
+
+    def search(self, text):
+        # Objects matching every term of text, a term matches when it's part of any
+        # indexed value of its field. Only the objects indexed so far are searched,
+        # changed is emitted once indexing is done.
+        self.start()
+        self._flush()
+
+        # A few added objects are done right away, the rest waits for the timer.
+        if self._pending:
+            self._index_pending()
+
+        result = None
+        for field, needle in self.parse_query(text):
+            matches = set()
+
+            for field_name in ([field] if field else self.FIELDS):
+                for value, objs in iteritems(self._values[field_name]):
+                    if needle in value:
+                        matches.update(objs)
+
+            result = matches if result is None else result & matches
+
+            if not result:
+                break
+
+        return result or set()
+
+    def first(self, objs, count):
+        # The count objects of objs that were indexed first.
+        return heapq.nsmallest(count, objs, key=self._order.get)
+
+    def ancestors(self, objs):
+        # Every ancestor of objs up to root, root included.
+        ancestors = set()
+
+        for obj in objs:
+            obj = obj.parent()
+
+            while obj is not None and obj not in ancestors and obj in self._object_values:
+                ancestors.add(obj)
+                obj = obj.parent()
+
+        return ancestors
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _children_changed(self, obj, event):
+        self._dirty_children.add(obj)
+        self._flush_timer.start()
+
+    def _values_changed(self, obj, event):
+        self._dirty_values.add(obj)
+        self._flush_timer.start()
+
+    def _name_changed(self, *args):
+        self._dirty_values.add(self.sender())
+        self._flush_timer.start()
+
+    def _index_step(self):
+        if self._index_pending():
+            self.changed.emit()
+
+    def _flush_changes(self):
+        if self._flush():
+            self.changed.emit()
@@ -0,0 +1,586 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import os
+import sys
+import tempfile
+import functools
+
+from Qt import QtGui, QtCore, QtWidgets
+
+from qss_debugger.explorer import VisualTreeExplorer
+from qss_debugger.parser import VisualQssParser, VisualQssRuleIndex
+from qss_debugger.profiler import VisualProfileReport, VisualStyleProfiler, clock
+from qss_debugger.styler import VisualStyleApplier
+from qss_debugger.builder import VisualBuildQueue, VisualBuildResult
+from qss_debugger.cache import VisualCompileCache
+from qss_debugger.compiler import VisualCompilerBase, VisualCompilerDefault, VisualSegmentCache, VisualVarsIndex
+from qss_debugger.optimizer import VisualOptimizeReport, VisualQssOptimizer
+from qss_debugger.log import LEVEL_DEBUG, LEVEL_WARNING, LEVEL_ERROR
+from qss_debugger.watcher import VisualFileWatcher
+
+
+# *********************************************************************
+# +++ CLASSES
+# *********************************************************************
+class VisualDebuggerService(QtCore.QObject):
+    # One per application, every attached window shares its watcher, compile and
+    # explorer. A build is applied to each attached window, or once on the
+    # QApplication, and the explorer shows the window selected in it.
+    HOVER_INTERVAL = 16
+
+    _instance = None
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None, compiler_type=None, debounce_interval=100, compile_cache_size=32 * 1024 * 1024):
+        super(VisualDebuggerService, self).__init__(parent)
+        # -- Compiler
+        self._compiler_type = compiler_type if compiler_type else VisualCompilerDefault
+        self._segment_cache = VisualSegmentCache()
+        self._template = None
+
+        # Work done so far, an untouched session must leave these unchanged.
+        self._work_counters = {'builds': 0, 'applies': 0, 'output_writes': 0}
+
+        self._build_queue = VisualBuildQueue(self)
+        self._build_queue.build_finished.connect(self._build_finished)
+        self._build_queue.build_failed.connect(self._build_failed)
+
+        # -- Windows
+        # Attached VisualTreeDebugger, the current one is shown in the explorer.
+        self._debuggers = []
+        self._current_debugger = None
+        self._application_style_applier = VisualStyleApplier(QtCore.QCoreApplication.instance())
+        self._style_sheet = None
+        self._rules = None
+
+        # -- Explorer
+        self._explorer = VisualTreeExplorer()
+        self._explorer.selection_changed.connect(self._selection_changed)
+        self._explorer.update_style_requested.connect(self._update_style)
+        self._explorer.closing.connect(self._save_settings)
+        self._explorer.settings_changed.connect(self._update_watcher)
+        self._explorer.variant_selected.connect(self._variant_selected)
+        self._explorer.optimize_output_changed.connect(self._optimize_output_changed)
+        self._explorer.apply_to_application_changed.connect(self._apply_to_application_changed)
+        self._explorer.hover_pick_changed.connect(self._hover_pick_changed)
+        self._explorer.highlight_layout_changes_changed.connect(self._highlight_layout_changes_changed)
+        self._explorer.root_selected.connect(self._root_selected)
+        self._explorer.show()
+
+        # -- Watcher
+        self._file_watcher = VisualFileWatcher(self, debounce_interval)
+        self._file_watcher.files_changed.connect(self._update_monitor)
+
+        # The compiled file is written after the style has been applied, rapid
+        # changes only write the latest result.
+        self._pending_output = None
+        self._output_write_timer = QtCore.QTimer(self)
+        self._output_write_timer.setSingleShot(True)
+        self._output_write_timer.timeout.connect(self._write_output)
+        self._explorer.closing.connect(self._write_output)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self._write_output)
+
+        # -- Picking
+        # A single timer polls the cursor for every window, only while enabled.
+        self._hover_pos = None
+        self._hover_timer = QtCore.QTimer(self)
+        self._hover_timer.setInterval(self.HOVER_INTERVAL)
+        self._hover_timer.timeout.connect(self._update_hover)
+
+        # -- Settings
+        parent_application_name = QtCore.QCoreApplication.applicationName()
+        self._settings = QtCore.QSettings('qssDebugger', parent_application_name)
+        self._load_settings()
+        self._update_watcher()
+
+        # -- Compile Cache
+        # Only read by the warm start. The latest compiled result is stored once,
+        # when the explorer closes or the application quits, live builds rely on
+        # the segment cache.
+        self._compile_cache = VisualCompileCache(self._compile_cache_path(), compile_cache_size)
+        self._compiled_entry = None
+        self._pending_cache_entry = None
+        self._explorer.closing.connect(self._store_compile_cache)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self._store_compile_cache)
+
+        # Warm start, unchanged inputs are loaded from the compile cache.
+        if self._explorer.is_settings_valid:
+            self._submit_build(None, warm_start=True)
+            self._explorer.log_message('Loading style...')
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def instance(compiler_type=None, debounce_interval=100, compile_cache_size=32 * 1024 * 1024):
+        # The arguments are only used by the call creating the service.
+        if VisualDebuggerService._instance is None:
+            VisualDebuggerService._instance = VisualDebuggerService(QtCore.QCoreApplication.instance(),
+                                                                    compiler_type,
+                                                                    debounce_interval,
+                                                                    compile_cache_size)
+
+        return VisualDebuggerService._instance
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _load_settings(self):
+        self._explorer.watch_css_folder_path = self._settings.value('watch_css_path')
+        self._explorer.watch_vars_folder_path = self._settings.value('watch_vars_path')
+        self._explorer.compiled_file_path = self._settings.value('compiled_css_path')
+        self._explorer.scoped_apply = self._settings.value('scoped_apply') in [True, 'true']
+        self._explorer.optimize_output = self._settings.value('optimize_output') in [True, 'true']
+        self._explorer.apply_to_application = self._settings.value('apply_to_application') in [True, 'true']
+        self._explorer.highlight_layout_changes = self._settings.value('highlight_layout_changes') in [True, 'true']
+
+    def _save_settings(self):
+        if self._explorer.is_settings_valid:
+            self._settings.setValue('watch_css_path', self._explorer.watch_css_folder_path)
+            self._settings.setValue('watch_vars_path', self._explorer.watch_vars_folder_path)
+            self._settings.setValue('compiled_css_path', self._explorer.compiled_file_path)
+            self._settings.setValue('scoped_apply', self._explorer.scoped_apply)
+            self._settings.setValue('optimize_output', self._explorer.optimize_output)
+            self._settings.setValue('apply_to_application', self._explorer.apply_to_application)
+            self._settings.setValue('highlight_layout_changes', self._explorer.highlight_layout_changes)
+
+    def _compile_cache_path(self):
+        # Beside the settings file, windows stores native settings in the registry
+        # so the local app data folder is used instead.
+        if sys.platform == 'win32' and self._settings.format() == QtCore.QSettings.NativeFormat:
+            settings_folder_path = os.path.join(os.environ.get('LOCALAPPDATA', tempfile.gettempdir()), 'qssDebugger')
+        else:
+            settings_folder_path = os.path.dirname(self._settings.fileName())
+
+        return os.path.join(settings_folder_path, 'cache', QtCore.QCoreApplication.applicationName() or 'default')
+
+    def _update_style(self, style_file_path=None):
+        if not style_file_path:
+            style_file_path = self._explorer.compiled_file_path
+
+        with open(style_file_path, 'r') as file_handle:
+            result = file_handle.read()
+
+        rules = VisualQssParser.parse(result)
+        apply_time = self._apply_style(result, rules=rules)
+        self._explorer.rule_index = VisualQssRuleIndex(rules)
+        self._explorer.log_message('Reloaded {}.'.format(style_file_path), apply_ms=apply_time * 1000.0)
+
+    def _style_appliers(self):
+        if self._explorer.apply_to_application:
+            return [self._application_style_applier]
+
+        return [debugger.style_applier for debugger in self._debuggers]
+
+    def _apply_style(self, style_sheet, scoped=False, rules=None):
+        # Returns the time spent applying, in seconds. The application style sheet
+        # is always applied in full, scoped patches are per window.
+        self._work_counters['applies'] += 1
+        self._style_sheet = style_sheet
+        self._rules = rules
+
+        scoped = scoped and not self._explorer.apply_to_application
+        style_appliers = self._style_appliers()
+
+        if self._explorer.highlight_layout_changes:
+            for debugger in self._debuggers:
+                debugger.capture_layout()
+
+        start_time = clock()
+        for style_applier in style_appliers:
+            style_applier.apply(style_sheet, scoped, rules)
+        apply_time = clock() - start_time
+
+        scoped_widget_count = sum([style_applier.last_widget_count for style_applier in style_appliers
+                                   if style_applier.last_mode == VisualStyleApplier.MODE_SCOPED])
+        full_reasons = [style_applier.last_reason for style_applier in style_appliers
+                        if style_applier.last_mode == VisualStyleApplier.MODE_FULL]
+
+        if scoped_widget_count:
+            self._explorer.log_message('Scoped update of {} widgets.'.format(scoped_widget_count), LEVEL_DEBUG)
+
+        if scoped and full_reasons:
+            self._explorer.log_message('Full update: {}.'.format(full_reasons[0]), LEVEL_WARNING,
+                                       windows=len(full_reasons))
+
+        return apply_time
+
+    def _schedule_output(self, style_sheet):
+        self._pending_output = style_sheet
+        self._output_write_timer.start(250)
+
+    def _write_output(self):
+        if self._pending_output is None:
+            return
+
+        style_sheet = self._pending_output
+        self._pending_output = None
+        self._work_counters['output_writes'] += 1
+
+        try:
+            self._compiler_type.write_output(style_sheet, self._explorer.compiled_file_path)
+        except (IOError, OSError) as error:
+            self._explorer.log_message('Could not write {}: {}'.format(self._explorer.compiled_file_path, error),
+                                       LEVEL_ERROR)
+
+    def _update_watcher(self):
+        if self._explorer.is_settings_valid:
+            self._file_watcher.set_folders([self._explorer.watch_css_folder_path,
+                                            self._explorer.watch_vars_folder_path])
+        else:
+            self._file_watcher.clear()
+
+    def _update_monitor(self, changed_paths):
+        if not self._explorer.is_settings_valid:
+            return
+
+        css_folder_path = os.path.normpath(self._explorer.watch_css_folder_path)
+        css_changed_paths = [file_path for file_path in changed_paths
+                             if os.path.dirname(file_path) == css_folder_path]
+
+        self._submit_build(css_changed_paths)
+        self._explorer.log_message('Change detected in {}, compiling...'.format(
+            ', '.join([os.path.basename(file_path) for file_path in changed_paths])),
+            queue_depth=self._build_queue.queue_depth)
+
+    def _submit_build(self, css_changed_paths, warm_start=False):
+        # Builds still queued may be skipped when superseded, so their changed paths
+        # would be lost: let the segment cache check every file in that case.
+        if self._build_queue.queue_depth:
+            css_changed_paths = None
+
+        self._work_counters['builds'] += 1
+        self._build_queue.submit(self._compile,
+                                 self._explorer.watch_css_folder_path,
+                                 self._explorer.watch_vars_folder_path,
+                                 css_changed_paths,
+                                 self._explorer.optimize_output,
+                                 warm_start)
+
+    def _compile(self, css_folder_path, vars_folder_path, changed_paths, optimize=False, warm_start=False):
+        # Runs on the build thread.
+        timings = {}
+        cache_entry = None
+        vars_index = None
+        changed_vars = None
+
+        # Reported in the explorer log, the compiler would print them on this thread.
+        unresolved_vars = []
+        invalid_vars = []
+
+        if warm_start:
+            start_time = clock()
+            cache_entry = self._compile_cache.load(self._compile_cache.key(css_folder_path, vars_folder_path,
+                                                                           self._compiler_type))
+            timings['cache'] = clock() - start_time
+
+        if cache_entry is not None:
+            # The segment cache is still empty, the next build reads every file.
+            result = cache_entry['style_sheet']
+            segment_lines = cache_entry['segment_lines']
+            segment_hits, segment_misses = len(segment_lines), 0
+        else:
+            result = None
+
+            if VisualCompilerBase.supports_template(self._compiler_type):
+                try:
+                    # The template is kept between builds, switching variants or editing
+                    # vars only renders it again.
+                    self._template = VisualCompilerBase.call(self._compiler_type.compile_template,
+                                                             css_folder_path,
+                                                             segment_cache=self._segment_cache,
+                                                             changed_paths=changed_paths,
+                                                             timings=timings,
+                                                             template=self._template)
+                    result = VisualCompilerBase.call(self._compiler_type.render, self._template,
+                                                     vars_folder_path, timings=timings,
+                                                     unresolved=unresolved_vars, invalid=invalid_vars)
+
+                    vars_table = getattr(self._template, 'last_vars_table', None)
+                    if vars_table is not None:
+                        vars_index = VisualVarsIndex(self._template, vars_table,
+                                                     self._segment_cache.segment_lines)
+                        changed_vars = self._template.last_changed_names
+                except NotImplementedError:
+                    result = None
+
+            if result is None:
+                result = VisualCompilerBase.call_compile(self._compiler_type.compile,
+                                                         css_folder_path,
+                                                         vars_folder_path,
+                                                         segment_cache=self._segment_cache,
+                                                         changed_paths=changed_paths,
+                                                         timings=timings,
+                                                         unresolved=unresolved_vars,
+                                                         invalid=invalid_vars)
+            segment_lines = self._segment_cache.segment_lines
+            segment_hits, segment_misses = self._segment_cache.last_hits, self._segment_cache.last_misses
+            self._compiled_entry = (css_folder_path, vars_folder_path, result, list(segment_lines))
+
+        # Rules come from the compiled style sheet so they point to the segments, the
+        # optimized one is equivalent.
+        start_time = clock()
+        rules = VisualQssParser.parse(result, segment_lines)
+        timings['parse'] = clock() - start_time
+
+        optimize_report = None
+        if optimize:
+            start_time = clock()
+            optimize_report = VisualOptimizeReport()
+            result = VisualQssOptimizer.optimize(result, optimize_report)
+            timings['optimize'] = clock() - start_time
+
+        return VisualBuildResult(result, rules, segment_hits, segment_misses, timings, cache_entry is not None,
+                                 vars_index, changed_vars, optimize_report, unresolved_vars, invalid_vars)
+
+    def _set_current_debugger(self, debugger):
+        if debugger is self._current_debugger:
+            return
+
+        if self._current_debugger is not None:
+            self._current_debugger.selected_items = []
+
+        self._current_debugger = debugger
+        self._explorer.current_root = debugger.root if debugger is not None else None
+        self.update_explorer_geometry(debugger)
+
+    def _debugger_for(self, visual_root):
+        for debugger in self._debuggers:
+            if debugger.root is visual_root:
+                return debugger
+
+        return None
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def explorer(self):
+        return self._explorer
+
+    @property
+    def debuggers(self):
+        return list(self._debuggers)
+
+    @property
+    def current_debugger(self):
+        return self._current_debugger
+
+    @property
+    def work_counters(self):
+        counters = dict(self._work_counters)
+        counters.update(self._explorer.validation_counters)
+        return counters
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def attach(self, debugger):
+        # Called by VisualTreeDebugger, the window gets the current style right away.
+        self._debuggers.append(debugger)
+        debugger.destroyed.connect(functools.partial(self.detach, debugger))
+        debugger.layout_compared.connect(self._layout_compared)
+        self._explorer.add_root(debugger.root)
+
+        if self._style_sheet is not None and not self._explorer.apply_to_application:
+            debugger.style_applier.apply(self._style_sheet, False, self._rules)
+
+        if self._current_debugger is None:
+            self._set_current_debugger(debugger)
+
+    def detach(self, debugger, *args):
+        if debugger not in self._debuggers:
+            return
+
+        self._debuggers.remove(debugger)
+        self._explorer.remove_root(debugger.root)
+
+        if debugger is self._current_debugger:
+            self._current_debugger = None
+            self._set_current_debugger(self._debuggers[0] if self._debuggers else None)
+
+    def select_item(self, debugger, visual_item):
+        # Picking in a window shows it in the explorer.
+        self._set_current_debugger(debugger)
+        self._explorer.set_selected_item(visual_item)
+
+    def update_explorer_geometry(self, debugger):
+        if debugger is None or debugger is not self._current_debugger:
+            return
+
+        window_geometry = debugger.root.geometry()
+        explorer_x = window_geometry.x() + window_geometry.width() + 12
+        explorer_y = window_geometry.y()
+        explorer_width = self._explorer.geometry().width()
+        explorer_height = window_geometry.height()
+        self._explorer.setGeometry(explorer_x, explorer_y, explorer_width, explorer_height)
+
+    def update_root_label(self, debugger):
+        self._explorer.update_root_label(debugger.root)
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _store_compile_cache(self):
+        # The inputs are hashed now, skipped while a change may still be building.
+        if (self._pending_cache_entry is None or self._build_queue.queue_depth or
+                self._file_watcher.has_pending_changes):
+            return
+
+        css_folder_path, vars_folder_path, style_sheet, segment_lines = self._pending_cache_entry
+        self._pending_cache_entry = None
+
+        try:
+            cache_key = self._compile_cache.key(css_folder_path, vars_folder_path, self._compiler_type)
+        except (IOError, OSError):
+            return
+
+        self._compile_cache.store(cache_key, style_sheet, segment_lines)
+
+    def _build_finished(self, result, duration):
+        # Only the latest build is delivered, the entry it compiled is the last one.
+        if not result.cached:
+            self._pending_cache_entry = self._compiled_entry
+
+        rule_index = VisualQssRuleIndex(result.rules)
+        apply_times = []
+
+        if self._explorer.profiling and self._current_debugger is not None:
+            report = VisualProfileReport()
+            for stage in ['compile', 'inject', 'parse', 'optimize']:
+                report.add_stage(stage, result.timings.get(stage, 0.0))
+
+            profiler = VisualStyleProfiler(self._current_debugger.root)
+            profiler.profile(lambda: apply_times.append(self._apply_style(result.style_sheet,
+                                                                          self._explorer.scoped_apply,
+                                                                          result.rules)),
+                             report, rule_index)
+            self._explorer.profile_report = report
+        else:
+            apply_times.append(self._apply_style(result.style_sheet, self._explorer.scoped_apply, result.rules))
+
+        self._schedule_output(result.style_sheet)
+        self._explorer.rule_index = rule_index
+        self._explorer.vars_index = result.vars_index
+
+        for name in result.invalid_vars:
+            self._explorer.log_message('Invalid variable name {}, ignored.'.format(name), LEVEL_WARNING)
+
+        for reference in result.unresolved_vars:
+            self._explorer.log_message('Unresolved variable {}.'.format(reference), LEVEL_WARNING)
+
+        if result.vars_index is not None:
+            for cycle in result.vars_index.cycles:
+                self._explorer.log_message('Variable cycle {}, left unresolved.'.format(' -> '.join(cycle)),
+                                           LEVEL_WARNING)
+
+            if result.changed_vars:
+                self._explorer.log_message('{} variables changed, {} segments affected.'.format(
+                    len(result.changed_vars), len(result.vars_index.affected_segments(result.changed_vars))),
+                    LEVEL_DEBUG)
+
+        fields = dict([(stage + '_ms', seconds * 1000.0) for stage, seconds in result.timings.items()])
+        if result.optimize_report is not None:
+            fields.update({'size_before': result.optimize_report.input_size,
+                           'size_after': result.optimize_report.output_size,
+                           'rules_before': result.optimize_report.input_rules,
+                           'rules_after': result.optimize_report.output_rules})
+
+        fields.update({'cached': result.cached,
+                       'build_ms': duration * 1000.0,
+                       'apply_ms': sum(apply_times) * 1000.0,
+                       'windows': 0 if self._explorer.apply_to_application else len(self._debuggers),
+                       'segments_cached': result.segment_hits,
+                       'segments_compiled': result.segment_misses})
+        self._explorer.log_message('...done.', **fields)
+
+    def _optimize_output_changed(self):
+        if not self._explorer.is_settings_valid:
+            return
+
+        # Same inputs, the compile cache or the template make this cheap.
+        self._submit_build([])
+        self._explorer.log_message('Optimize style sheet {}, compiling...'.format(
+            'enabled' if self._explorer.optimize_output else 'disabled'))
+
+    def _apply_to_application_changed(self):
+        # The other target drops the style sheet it was given.
+        if self._explorer.apply_to_application:
+            for debugger in self._debuggers:
+                debugger.style_applier.apply('', False)
+        else:
+            self._application_style_applier.apply('', False)
+
+        if self._style_sheet is not None:
+            self._apply_style(self._style_sheet, self._explorer.scoped_apply, self._rules)
+
+    def _variant_selected(self, vars_folder_path):
+        if not self._explorer.is_settings_valid:
+            return
+
+        # The segments didn't change, only the vars are read and rendered.
+        self._submit_build([])
+        self._explorer.log_message('Switching to variant {}...'.format(os.path.basename(vars_folder_path)))
+
+    def _build_failed(self, message):
+        self._explorer.log_message('...failed.\n{}'.format(message), LEVEL_ERROR)
+
+    def _root_selected(self, visual_root):
+        self._set_current_debugger(self._debugger_for(visual_root))
+
+    def _hover_pick_changed(self, enabled):
+        self._hover_pos = None
+
+        if enabled:
+            self._hover_timer.start()
+        else:
+            self._hover_timer.stop()
+
+            for debugger in self._debuggers:
+                debugger.hovered_item = None
+                debugger.stop_picking()
+
+    def _update_hover(self):
+        cursor_pos = QtGui.QCursor.pos()
+
+        if cursor_pos == self._hover_pos:
+            return
+
+        self._hover_pos = cursor_pos
+        window = QtWidgets.QApplication.topLevelAt(cursor_pos)
+
+        for debugger in self._debuggers:
+            if debugger.root is window:
+                debugger.hovered_item = debugger.widget_at(window.mapFromGlobal(cursor_pos))
+            else:
+                debugger.hovered_item = None
+
+    def _highlight_layout_changes_changed(self, enabled):
+        if not enabled:
+            for debugger in self._debuggers:
+                debugger.clear_layout_changes()
+
+    def _layout_compared(self, changed_count, duration):
+        self._explorer.log_message('Layout changed for {} widgets.'.format(changed_count), LEVEL_DEBUG,
+                                   layout_ms=duration * 1000.0)
+
+    def _selection_changed(self, visual_items):
+        if self._current_debugger is not None:
+            self._current_debugger.selected_items = visual_items
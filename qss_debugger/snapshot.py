@@ -0,0 +1,196 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import operator
+import itertools
+from array import array
+
+from Qt import QtCore, QtWidgets
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualLayoutSnapshot(object):
+    # rect and contentsRect of every widget under root, in root coordinates, one
+    # row of FIELDS per widget in tree order. Rows are a (count, FIELD_COUNT)
+    # NumPy array when NumPy is available so two snapshots are compared in a few
+    # vectorized operations, a flat int array otherwise.
+    FIELDS = ['x', 'y', 'width', 'height', 'content_x', 'content_y', 'content_width', 'content_height']
+    FIELD_COUNT = len(FIELDS)
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, widgets, values):
+        self._widgets = widgets
+        self._values = values
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _resolve_numpy(values, parent_rows, excluded_flags):
+        # Pointer jumping, every pass adds the offset of the farthest ancestor known
+        # so far and skips to its own, the passes grow with log(depth).
+        values = numpy.frombuffer(values, dtype=numpy.int32).reshape(-1, VisualLayoutSnapshot.FIELD_COUNT).copy()
+        ancestor_rows = numpy.frombuffer(parent_rows, dtype=numpy.int32).astype(numpy.intp)
+        excluded_flags = numpy.frombuffer(excluded_flags, dtype=numpy.bool_).copy()
+        offsets = values[:, :2].copy()
+
+        while True:
+            linked_rows = numpy.flatnonzero(ancestor_rows >= 0)
+
+            if not linked_rows.size:
+                break
+
+            linked_ancestors = ancestor_rows[linked_rows]
+            offsets[linked_rows] += offsets[linked_ancestors]
+            excluded_flags[linked_rows] |= excluded_flags[linked_ancestors]
+            ancestor_rows[linked_rows] = ancestor_rows[linked_ancestors]
+
+        values[:, :2] = offsets
+        values[:, 4:6] += offsets
+
+        kept_flags = ~excluded_flags
+        return values[kept_flags], kept_flags.tolist()
+
+    @staticmethod
+    def _resolve(values, parent_rows, excluded_flags):
+        # findChildren lists parents before their children, each widget is offset
+        # by its parent, already in root coordinates.
+        field_count = VisualLayoutSnapshot.FIELD_COUNT
+        kept_flags = [not excluded for excluded in excluded_flags]
+
+        for row in range(1, len(parent_rows)):
+            parent_row = parent_rows[row]
+
+            if not kept_flags[row] or not kept_flags[parent_row]:
+                kept_flags[row] = False
+                continue
+
+            offset = row * field_count
+            parent_offset = parent_row * field_count
+            values[offset] += values[parent_offset]
+            values[offset + 1] += values[parent_offset + 1]
+            values[offset + 4] += values[offset]
+            values[offset + 5] += values[offset + 1]
+
+        kept_values = array('i', itertools.chain.from_iterable(
+            [values[row * field_count:(row + 1) * field_count] for row in itertools.compress(
+                range(len(kept_flags)), kept_flags)]))
+        return kept_values, kept_flags
+
+    @staticmethod
+    def capture(root, excluded=None):
+        # Child windows and excluded widgets are left out with their descendants.
+        # Qt is called once per widget and value kind, offsets to root coordinates
+        # and exclusions are resolved on the arrays afterwards.
+        widgets = [root] + root.findChildren(QtWidgets.QWidget)
+        rows = dict(zip(widgets, range(len(widgets))))
+
+        parent_rows = array('i', [rows.get(parent, -1) for parent in map(QtWidgets.QWidget.parentWidget, widgets)])
+        parent_rows[0] = -1
+
+        geometries = map(QtCore.QRect.getRect, map(QtWidgets.QWidget.geometry, widgets))
+        content_rects = map(QtCore.QRect.getRect, map(QtWidgets.QWidget.contentsRect, widgets))
+        values = array('i', itertools.chain.from_iterable(map(operator.add, geometries, content_rects)))
+        values[0] = values[1] = 0
+
+        # Widgets whose parent isn't a widget under root are dropped too.
+        excluded_flags = array('b', [parent_row < 0 for parent_row in parent_rows])
+        excluded_flags[0] = False
+
+        for widget in itertools.chain(excluded or [], QtWidgets.QApplication.topLevelWidgets()):
+            row = rows.get(widget)
+
+            if row:
+                excluded_flags[row] = True
+
+        if numpy is not None:
+            values, kept_flags = VisualLayoutSnapshot._resolve_numpy(values, parent_rows, excluded_flags)
+        else:
+            values, kept_flags = VisualLayoutSnapshot._resolve(values, parent_rows, excluded_flags)
+
+        return VisualLayoutSnapshot(list(itertools.compress(widgets, kept_flags)), values)
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _row_values(self, row):
+        if numpy is not None:
+            return self._values[row]
+
+        offset = row * self.FIELD_COUNT
+        return self._values[offset:offset + self.FIELD_COUNT]
+
+    def _same_widgets(self, other):
+        return len(self._widgets) == len(other._widgets) and all(map(operator.is_, self._widgets, other._widgets))
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def widgets(self):
+        return self._widgets
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def size(self):
+        return len(self._widgets)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def rect(self, row):
+        return QtCore.QRect(*[int(value) for value in self._row_values(row)[:4]])
+
+    def content_rect(self, row):
+        return QtCore.QRect(*[int(value) for value in self._row_values(row)[4:]])
+
+    def diff(self, other):
+        # Rows of other whose widget is new or has a different rect or contentsRect.
+        # The hierarchy rarely changes on a reload, rows are then compared in order.
+        if self._same_widgets(other):
+            if numpy is not None:
+                return numpy.flatnonzero((self._values != other._values).any(axis=1)).tolist()
+
+            if self._values == other._values:
+                return []
+
+            return [row for row in range(other.size) if self._row_values(row) != other._row_values(row)]
+
+        rows = dict(zip(self._widgets, range(self.size)))
+        other_rows = [rows.get(widget, -1) for widget in other._widgets]
+
+        if numpy is not None:
+            other_rows = numpy.array(other_rows, dtype=numpy.intp)
+            changed = other_rows < 0
+            common = ~changed
+            changed[common] = (self._values[other_rows[common]] != other._values[common]).any(axis=1)
+            return numpy.flatnonzero(changed).tolist()
+
+        return [other_row for other_row, row in enumerate(other_rows)
+                if row < 0 or self._row_values(row) != other._row_values(other_row)]
@@ -0,0 +1,256 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+from Qt import QtCore, QtWidgets
+
+from qss_debugger.events import VisualTreeEventFilter
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualSpatialIndex(QtCore.QObject):
+    # Uniform grid of the widget rects under root, in root coordinates, so the
+    # widgets under a point are found by looking at a single cell. Every indexed
+    # widget is watched, moves, resizes and children changes only mark it dirty
+    # and the affected entries are updated before the next query.
+    CELL_SIZE = 64
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, root, excluded=None, parent=None):
+        super(VisualSpatialIndex, self).__init__(parent)
+        self._root = root
+        self._excluded = set(excluded or [])
+
+        # {widget: (left, top, right, bottom, path)} clipped by the ancestors, right
+        # and bottom are exclusive. path is the index of each ancestor between its
+        # siblings, from root, so sorting by it gives the paint order.
+        self._entries = {}
+        self._children = {}
+        self._cells = {}
+        self._grid = {}
+
+        # Widgets whose rect and descendants must be indexed again.
+        self._dirty_subtrees = set()
+        self._started = False
+
+        self._counters = {'indexed': 0, 'queries': 0}
+
+        self._event_filter = VisualTreeEventFilter(self, {QtCore.QEvent.Move: self._geometry_changed,
+                                                          QtCore.QEvent.Resize: self._geometry_changed,
+                                                          QtCore.QEvent.Show: self._geometry_changed,
+                                                          QtCore.QEvent.ChildAdded: self._children_changed,
+                                                          QtCore.QEvent.ChildRemoved: self._children_changed})
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _cell_keys(self, left, top, right, bottom):
+        cell_size = self.CELL_SIZE
+        return [(cell_x, cell_y)
+                for cell_x in range(left // cell_size, (right - 1) // cell_size + 1)
+                for cell_y in range(top // cell_size, (bottom - 1) // cell_size + 1)]
+
+    def _insert(self, item, entry):
+        self._entries[item] = entry
+        cell_keys = self._cell_keys(*entry[:4]) if entry[2] > entry[0] and entry[3] > entry[1] else []
+        self._cells[item] = cell_keys
+
+        for cell_key in cell_keys:
+            self._grid.setdefault(cell_key, set()).add(item)
+
+    def _remove(self, item):
+        self._entries.pop(item, None)
+
+        for cell_key in self._cells.pop(item, []):
+            cell_items = self._grid.get(cell_key)
+
+            if cell_items is not None:
+                cell_items.discard(item)
+
+                if not cell_items:
+                    del self._grid[cell_key]
+
+    def _remove_subtree(self, item):
+        stack = list(self._children.pop(item, []))
+
+        while stack:
+            child = stack.pop()
+            stack.extend(self._children.pop(child, []))
+            self._remove(child)
+
+            try:
+                child.removeEventFilter(self._event_filter)
+            except RuntimeError:
+                # The child was deleted.
+                pass
+
+    def _child_items(self, item):
+        return [child for child in item.children()
+                if isinstance(child, QtWidgets.QWidget) and not child.isWindow() and child not in self._excluded]
+
+    def _clip_entry(self, item, left, top, parent_entry, order):
+        # Parts outside the ancestors can't be under the cursor.
+        return (max(left, parent_entry[0]), max(top, parent_entry[1]),
+                min(left + item.width(), parent_entry[2]), min(top + item.height(), parent_entry[3]),
+                parent_entry[4] + (order,))
+
+    def _index_subtree(self, item):
+        # Children rects are offset from their parent, only the subtree root is
+        # mapped to root coordinates.
+        self._remove_subtree(item)
+
+        if item is self._root:
+            origin = QtCore.QPoint(0, 0)
+            entry = self._root_entry()
+        else:
+            parent_item = item.parentWidget()
+            parent_entry = self._root_entry() if parent_item is self._root else self._entries[parent_item]
+            origin = item.mapTo(self._root, QtCore.QPoint(0, 0))
+            entry = self._clip_entry(item, origin.x(), origin.y(), parent_entry, self._entries[item][4][-1])
+            self._remove(item)
+            self._insert(item, entry)
+
+        stack = [(item, origin.x(), origin.y(), entry)]
+
+        while stack:
+            parent_item, parent_x, parent_y, parent_entry = stack.pop()
+            child_items = self._child_items(parent_item)
+            self._children[parent_item] = child_items
+
+            for order, child in enumerate(child_items):
+                child_x = parent_x + child.x()
+                child_y = parent_y + child.y()
+                child_entry = self._clip_entry(child, child_x, child_y, parent_entry, order)
+
+                self._insert(child, child_entry)
+                child.installEventFilter(self._event_filter)
+                stack.append((child, child_x, child_y, child_entry))
+
+        self._counters['indexed'] += 1
+
+    def _root_entry(self):
+        return (0, 0, self._root.width(), self._root.height(), ())
+
+    def _is_indexed(self, item):
+        return item is self._root or item in self._entries
+
+    def _flush(self):
+        if not self._started:
+            self.start()
+
+        dirty_subtrees = self._dirty_subtrees
+        self._dirty_subtrees = set()
+
+        for item in dirty_subtrees:
+            try:
+                if self._is_indexed(item):
+                    self._index_subtree(item)
+            except RuntimeError:
+                # Deleted, its parent removes it once ChildRemoved is handled.
+                self._remove_subtree(item)
+                self._remove(item)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def counters(self):
+        return dict(self._counters, size=len(self._entries), cells=len(self._grid))
+
+    @property
+    def is_started(self):
+        return self._started
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def start(self):
+        # The first query starts the index, nothing is watched before.
+        self._started = True
+        self._root.installEventFilter(self._event_filter)
+        self._index_subtree(self._root)
+
+    def stop(self):
+        # Removes the event filters, the next query starts again.
+        if not self._started:
+            return
+
+        self._remove_subtree(self._root)
+
+        try:
+            self._root.removeEventFilter(self._event_filter)
+        except RuntimeError:
+            pass
+
+        self._dirty_subtrees = set()
+        self._started = False
+
+    def widgets_at(self, point):
+        # Visible widgets containing point (root coordinates), topmost and deepest
+        # first.
+        self._flush()
+        self._counters['queries'] += 1
+
+        x = point.x()
+        y = point.y()
+        cell_items = self._grid.get((x // self.CELL_SIZE, y // self.CELL_SIZE), ())
+        hits = []
+
+        for item in cell_items:
+            left, top, right, bottom, path = self._entries[item]
+
+            if left <= x < right and top <= y < bottom:
+                hits.append((path, item))
+
+        # Reversed paint order, children come before their parent.
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+
+        result = []
+        for _, item in hits:
+            try:
+                if item.isVisibleTo(self._root):
+                    result.append(item)
+            except RuntimeError:
+                continue
+
+        return result
+
+    def widget_at(self, point):
+        items = self.widgets_at(point)
+        return items[0] if items else None
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _geometry_changed(self, obj, event):
+        # Descendants move with it and are clipped by it, root coordinates don't
+        # depend on the root position but its size clips everything.
+        if obj is not self._root or event.type() == QtCore.QEvent.Resize:
+            self._dirty_subtrees.add(obj)
+        return False
+
+    def _children_changed(self, obj, event):
+        # Layouts, timers and other objects added don't matter, a removed child is
+        # already half destroyed so it isn't checked.
+        if event.type() == QtCore.QEvent.ChildAdded and not event.child().isWidgetType():
+            return False
+
+        self._dirty_subtrees.add(obj)
+        return False
@@ -0,0 +1,224 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+from future.utils import iteritems
+
+from Qt import QtWidgets
+
+from qss_debugger.parser import VisualQssParser
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualStyleApplier(object):
+    # Setting a style sheet on the root re-polishes every descendant. In scoped mode
+    # the root keeps the last fully applied sheet and the widgets matched by rules
+    # that changed since get a patch sheet with every rule that matches them, each
+    # selector narrowed to the widget itself through a dynamic property. Qt always
+    # prefers the widget's own sheet over inherited ones, so the patch wins over the
+    # stale root rules as long as no declaration was removed.
+    MODE_FULL = 'full'
+    MODE_SCOPED = 'scoped'
+    MODE_UNCHANGED = 'unchanged'
+
+    PATCH_PROPERTY = 'qssDebuggerPatch'
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, root, max_scoped_widgets=256):
+        self._root = root
+        self._max_scoped_widgets = max_scoped_widgets
+
+        self._style_sheet = None
+        self._root_style_sheet = None
+        self._root_declarations = None
+        self._patches = {}
+        self._patch_count = 0
+
+        self.last_mode = None
+        self.last_reason = ''
+        self.last_widget_count = 0
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _declarations(rules):
+        # Effective declarations of every selector, later rules override earlier ones.
+        declarations = {}
+
+        for rule in rules:
+            for selector in rule.selectors:
+                declarations.setdefault(selector.text, {}).update(rule.declarations)
+
+        return declarations
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _unsafe(self, reason):
+        self.last_reason = reason
+        return None
+
+    def _scoped_patches(self, rules):
+        if not all(rule.valid for rule in rules):
+            return self._unsafe('unsupported selector')
+
+        declarations = self._declarations(rules)
+
+        for selector_text, old_declarations in iteritems(self._root_declarations):
+            new_declarations = declarations.get(selector_text)
+
+            if new_declarations is None:
+                return self._unsafe('rule removed: {}'.format(selector_text))
+
+            if not set(new_declarations).issuperset(old_declarations):
+                return self._unsafe('declaration removed: {}'.format(selector_text))
+
+        changed_selectors = set([selector_text for selector_text, new_declarations in iteritems(declarations)
+                                 if self._root_declarations.get(selector_text) != new_declarations])
+
+        selectors = [selector for rule in rules for selector in rule.selectors
+                     if selector.text in changed_selectors]
+
+        if selectors and any(selector.matches(self._root) for selector in selectors):
+            return self._unsafe('root widget affected')
+
+        widgets = []
+
+        for widget in self._root.findChildren(QtWidgets.QWidget):
+            if not any(selector.matches(widget) for selector in selectors):
+                continue
+
+            if widget not in self._patches and widget.styleSheet():
+                return self._unsafe('widget has its own style sheet')
+
+            if len(widgets) == self._max_scoped_widgets:
+                return self._unsafe('more than {} widgets affected'.format(self._max_scoped_widgets))
+
+            widgets.append(widget)
+
+        patches = {}
+
+        for widget in widgets:
+            patch_id = self._patches[widget][0] if widget in self._patches else self._next_patch_id()
+            attribute = '[{}="{}"]'.format(self.PATCH_PROPERTY, patch_id)
+
+            patch_rules = ['{} {{ {} }}'.format(', '.join([selector.scoped(attribute)
+                                                           for selector in rule.selectors
+                                                           if selector.matches(widget)]),
+                                                rule.body)
+                           for rule in rules if rule.matches(widget)]
+
+            patches[widget] = (patch_id, '\n'.join(patch_rules))
+
+        return patches
+
+    def _next_patch_id(self):
+        self._patch_count += 1
+        return self._patch_count
+
+    def _set_patch(self, widget, patch):
+        try:
+            if patch is None:
+                widget.setStyleSheet('')
+                widget.setProperty(self.PATCH_PROPERTY, None)
+            else:
+                widget.setProperty(self.PATCH_PROPERTY, patch[0])
+                widget.setStyleSheet(patch[1])
+        except RuntimeError:
+            # The widget was deleted.
+            pass
+
+    def _apply_full(self, style_sheet, rules, reason):
+        for widget in self._patches:
+            self._set_patch(widget, None)
+
+        self._patches = {}
+        self._root.setStyleSheet(style_sheet)
+
+        self._root_style_sheet = style_sheet
+        self._root_declarations = self._declarations(rules) if rules is not None else None
+
+        self.last_mode = self.MODE_FULL
+        self.last_reason = reason
+        self.last_widget_count = 0
+
+        return self.last_mode
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def style_sheet(self):
+        return self._style_sheet
+
+    @property
+    def patched_widgets(self):
+        return list(self._patches)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def apply(self, style_sheet, scoped=True, rules=None):
+        previous_style_sheet = self._style_sheet
+        self._style_sheet = style_sheet
+
+        if not scoped:
+            return self._apply_full(style_sheet, None, 'scoped mode disabled')
+
+        if rules is None:
+            rules = VisualQssParser.parse(style_sheet)
+
+        if self._root_declarations is None or self._root.styleSheet() != self._root_style_sheet:
+            return self._apply_full(style_sheet, rules, 'no previous scoped state')
+
+        if style_sheet == previous_style_sheet:
+            self.last_mode = self.MODE_UNCHANGED
+            self.last_reason = ''
+            return self.last_mode
+
+        patches = self._scoped_patches(rules)
+
+        if patches is None:
+            return self._apply_full(style_sheet, rules, self.last_reason)
+
+        changed_count = 0
+
+        for widget in self._patches:
+            if widget not in patches:
+                self._set_patch(widget, None)
+                changed_count += 1
+
+        for widget, patch in iteritems(patches):
+            if self._patches.get(widget) != patch:
+                self._set_patch(widget, patch)
+                changed_count += 1
+
+        self._patches = patches
+
+        self.last_mode = self.MODE_SCOPED
+        self.last_reason = ''
+        self.last_widget_count = changed_count
+
+        return self.last_mode
+
+    def apply_full(self, style_sheet):
+        self._style_sheet = style_sheet
+        return self._apply_full(style_sheet, VisualQssParser.parse(style_sheet), 'full apply requested')
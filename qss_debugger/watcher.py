@@ -0,0 +1,171 @@
+# Copyright 2018 Ruben Henares
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# *********************************************************************
+# +++ IMPORTS
+# *********************************************************************
+import os
+
+from Qt import QtCore
+
+
+# *********************************************************************
+# +++ CLASS
+# *********************************************************************
+class VisualFileWatcher(QtCore.QObject):
+    # =====================================================================
+    # +++ SIGNALS
+    # =====================================================================
+    files_changed = QtCore.Signal(list)
+
+    # =====================================================================
+    # +++ CONSTRUCTOR
+    # =====================================================================
+    def __init__(self, parent=None, debounce_interval=100):
+        super(VisualFileWatcher, self).__init__(parent)
+        self._folder_paths = []
+        self._file_index = {}
+        self._pending_paths = set()
+
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._file_changed)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+
+        # Editors usually save in several steps (truncate, write, rename...), the
+        # notifications received within the debounce window are reported together.
+        self._debounce_timer = QtCore.QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.setInterval(debounce_interval)
+        self._debounce_timer.timeout.connect(self._flush)
+
+    # ====================================================================
+    # +++ STATIC METHODS
+    # =====================================================================
+    @staticmethod
+    def _stat(file_path):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        return file_stat.st_mtime, file_stat.st_size
+
+    # ====================================================================
+    # +++ PRIVATE METHODS
+    # =====================================================================
+    def _list_files(self, folder_path):
+        try:
+            file_names = os.listdir(folder_path)
+        except OSError:
+            return []
+
+        file_paths = [os.path.join(folder_path, file_name) for file_name in file_names]
+        return [file_path for file_path in file_paths if os.path.isfile(file_path)]
+
+    def _watch(self, file_path):
+        if file_path not in self._watcher.files():
+            self._watcher.addPath(file_path)
+
+    # ====================================================================
+    # +++ GET/SET
+    # =====================================================================
+    @property
+    def debounce_interval(self):
+        return self._debounce_timer.interval()
+
+    @debounce_interval.setter
+    def debounce_interval(self, value):
+        self._debounce_timer.setInterval(value)
+
+    @property
+    def folder_paths(self):
+        return list(self._folder_paths)
+
+    @property
+    def has_pending_changes(self):
+        return bool(self._pending_paths) or self._debounce_timer.isActive()
+
+    @property
+    def file_paths(self):
+        return sorted(self._file_index)
+
+    # ====================================================================
+    # +++ PUBLIC METHODS
+    # =====================================================================
+    def set_folders(self, folder_paths):
+        folder_paths = [os.path.normpath(folder_path) for folder_path in folder_paths]
+
+        if folder_paths == self._folder_paths:
+            return
+
+        watched_paths = self._watcher.files() + self._watcher.directories()
+        if watched_paths:
+            self._watcher.removePaths(watched_paths)
+
+        self._debounce_timer.stop()
+        self._pending_paths = set()
+        self._file_index = {}
+        self._folder_paths = folder_paths
+
+        for folder_path in folder_paths:
+            if not os.path.isdir(folder_path):
+                continue
+
+            self._watcher.addPath(folder_path)
+
+            for file_path in self._list_files(folder_path):
+                self._file_index[file_path] = self._stat(file_path)
+                self._watcher.addPath(file_path)
+
+    def clear(self):
+        self.set_folders([])
+
+    # ====================================================================
+    # +++ CALLBACKS
+    # =====================================================================
+    def _file_changed(self, file_path):
+        self._pending_paths.add(file_path)
+        self._debounce_timer.start()
+
+    def _directory_changed(self, folder_path):
+        # Files added to or removed from a folder, diffed against the index on flush.
+        listed_paths = set(self._list_files(folder_path))
+        indexed_paths = set([file_path for file_path in self._file_index
+                             if os.path.dirname(file_path) == folder_path])
+
+        self._pending_paths.update(listed_paths ^ indexed_paths)
+        self._debounce_timer.start()
+
+    def _flush(self):
+        changed_paths = []
+
+        for file_path in self._pending_paths:
+            file_state = self._stat(file_path)
+
+            if file_state is None:
+                if self._file_index.pop(file_path, False) is not False:
+                    changed_paths.append(file_path)
+                continue
+
+            # Files replaced on save are dropped by the watcher, watch them again.
+            self._watch(file_path)
+
+            if self._file_index.get(file_path) != file_state:
+                self._file_index[file_path] = file_state
+                changed_paths.append(file_path)
+
+        self._pending_paths = set()
+
+        if changed_paths:
+            self.files_changed.emit(sorted(changed_paths))
@@ -5,6 +5,7 @@ setup(
     version='0.1.5',
     packages=['qss_debugger'],
     install_requires=['future', 'Qt.py'],
+    entry_points={'console_scripts': ['qss-compile=qss_debugger.cli:main']},
     url='https://github.com/rubenhenares/qss_debugger',
     license='Apache License 2.0',
     author='Ruben Henares',